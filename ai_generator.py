@@ -1,168 +1,397 @@
-import torch
-from diffusers import StableDiffusionControlNetPipeline, ControlNetModel, DPMSolverMultistepScheduler
+from functools import lru_cache
 from PIL import Image
 import os
 import gc
+import random
+import threading
+
+# torch / diffusers are imported lazily (inside the functions that need them) so that importing this
+# module and creating the singleton stays cheap for code paths that never generate.
+
+
+# Oldest diffusers that can load a bitsandbytes-quantized UNet from a single file
+_QUANT_MIN_DIFFUSERS = (0, 32)
+
+
+@lru_cache(maxsize=None)
+def get_device():
+    """Detect device once (Prioritize MPS for Mac)."""
+    import torch
+
+    if torch.backends.mps.is_available():
+        print("🚀 Using MPS (Metal Performance Shaders) acceleration for Mac")
+        return "mps"
+    if torch.cuda.is_available():
+        return "cuda"
+    return "cpu"
+
+
+def _enable_unet_cuda_graphs(unet, graphs: dict):
+    """
+    Replays the UNet forward from captured CUDA graphs instead of launching every kernel from Python.
+    One graph is captured per input signature (latent, prompt embedding and ControlNet residual shapes)
+    and stored in `graphs`. Calls that don't match the static ControlNet signature run eagerly.
+    Only the UNet is captured: ControlNet bakes the per-step conditioning scale into its kernels.
+    A graph's static buffers are shared by every call with its signature, so callers must not run
+    the pipeline concurrently (AI_Generator holds _pipe_lock for the whole pipeline call).
+    """
+    import torch
+
+    eager_forward = unet.forward
+
+    def forward(sample, timestep, encoder_hidden_states, *args,
+                down_block_additional_residuals=None, mid_block_additional_residual=None,
+                return_dict=True, **kwargs):
+        if (args or return_dict or any(v is not None for v in kwargs.values())
+                or down_block_additional_residuals is None or mid_block_additional_residual is None
+                or not torch.is_tensor(timestep) or timestep.device != sample.device):
+            return eager_forward(sample, timestep, encoder_hidden_states, *args,
+                                 down_block_additional_residuals=down_block_additional_residuals,
+                                 mid_block_additional_residual=mid_block_additional_residual,
+                                 return_dict=return_dict, **kwargs)
+
+        key = (tuple(sample.shape), tuple(encoder_hidden_states.shape),
+               tuple(tuple(r.shape) for r in down_block_additional_residuals))
+        entry = graphs.get(key)
+        if entry is None:
+            static_in = {
+                "sample": sample.clone(),
+                "timestep": timestep.clone(),
+                "encoder_hidden_states": encoder_hidden_states.clone(),
+                "down_block_additional_residuals": [r.clone() for r in down_block_additional_residuals],
+                "mid_block_additional_residual": mid_block_additional_residual.clone(),
+            }
+            # Warm up on a side stream so cuBLAS/cuDNN handles exist before capture
+            stream = torch.cuda.Stream()
+            stream.wait_stream(torch.cuda.current_stream())
+            with torch.cuda.stream(stream):
+                for _ in range(3):
+                    eager_forward(**static_in, return_dict=False)
+            torch.cuda.current_stream().wait_stream(stream)
+
+            graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(graph):
+                static_out = eager_forward(**static_in, return_dict=False)[0]
+            entry = graphs[key] = (static_in, static_out, graph)
+            print(f"⚡ Captured UNet CUDA graph for {key[0]}")
+
+        static_in, static_out, graph = entry
+        static_in["sample"].copy_(sample)
+        static_in["timestep"].copy_(timestep)
+        static_in["encoder_hidden_states"].copy_(encoder_hidden_states)
+        for buf, res in zip(static_in["down_block_additional_residuals"], down_block_additional_residuals):
+            buf.copy_(res)
+        static_in["mid_block_additional_residual"].copy_(mid_block_additional_residual)
+        graph.replay()
+        return (static_out.clone(),)
+
+    unet.forward = forward
 
-# Detect device (Prioritize MPS for Mac)
-if torch.backends.mps.is_available():
-    DEVICE = "mps"
-    print("🚀 Using MPS (Metal Performance Shaders) acceleration for Mac")
-elif torch.cuda.is_available():
-    DEVICE = "cuda"
-else:
-    DEVICE = "cpu"
 
 class AI_Generator:
     _instance = None
+    # (cn_path, single_file_path, model_id_or_path, variant), resolved once; see reload_models()
+    _resolved_model_path = None
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(AI_Generator, cls).__new__(cls)
             cls._instance.pipe = None
             cls._instance.current_mode = None
+            cls._instance.current_quant = None
+            cls._instance._unet_graphs = {}
+            cls._instance._generator = None
+            cls._instance._deepcache = None
+            # Serializes loading and every pipeline call: the pipeline, its captured graphs,
+            # the DeepCache state and the reseeded generator are all shared per process
+            cls._instance._pipe_lock = threading.RLock()
         return cls._instance
 
-    def load_model(self, mode="balanced"):
+    def load_model(self, mode="balanced", quant=None):
+        """
+        quant: None (full precision), "nf4" (4-bit) or "int8" weights for UNet + ControlNet via bitsandbytes.
+        Quantization is CUDA-only; it is ignored on MPS/CPU.
+        """
         # If model is already loaded in the correct mode, skip
-        if self.pipe is not None and self.current_mode == mode:
+        if self.pipe is not None and self.current_mode == mode and self.current_quant == quant:
             return
+        # A startup preload and the first request can both get here; only one of them loads
+        with self._pipe_lock:
+            if self.pipe is not None and self.current_mode == mode and self.current_quant == quant:
+                return
+            self._load_model(mode, quant)
+
+    def _load_model(self, mode, quant):
+        import torch
+        from diffusers import StableDiffusionControlNetPipeline, ControlNetModel, DPMSolverMultistepScheduler, UNet2DConditionModel
+
+        device = get_device()
         
         # If switching modes, force reload
         if self.pipe is not None:
             print(f"🔄 Switching mode from {self.current_mode} to {mode}. Reloading...")
             del self.pipe
             self.pipe = None
+            self._deepcache = None
+            self._unet_graphs.clear()
             gc.collect()
-            if DEVICE == "mps":
+            if device == "mps":
                 torch.mps.empty_cache()
         
         self.current_mode = mode
-        
-        # Cleanup memory before loading
-        gc.collect()
-        if DEVICE == "mps":
-            torch.mps.empty_cache()
+        self.current_quant = quant
 
         print(f"Loading AI Models in [{mode.upper()}] mode...")
         
         # 1. Load ControlNet
         # USE FLOAT32 FOR STABILITY ON MAC/MPS
         # MPS has issues with mixed precision (float16) in some layers
-        dtype_to_use = torch.float32 
+        # CUDA uses BF16: same exponent range as FP32 (no fp16 overflow/NaN) at half the bandwidth
+        dtype_to_use = torch.bfloat16 if device == "cuda" else torch.float32
+
+        # Optional weight quantization (bitsandbytes has no MPS backend, so CUDA only)
+        quant_config = None
+        if quant is not None:
+            if device != "cuda":
+                print(f"⚠️ {quant} quantization requires CUDA, loading full precision weights")
+            else:
+                import diffusers
+
+                # BitsAndBytesConfig arrived in 0.31; quantizing a single-file UNet needs 0.32
+                if tuple(int(p) for p in diffusers.__version__.split(".")[:2]) < _QUANT_MIN_DIFFUSERS:
+                    raise ImportError(
+                        f"{quant} quantization needs diffusers>={'.'.join(map(str, _QUANT_MIN_DIFFUSERS))} "
+                        f"(installed: {diffusers.__version__}) and bitsandbytes: "
+                        "pip install -U 'diffusers>=0.32' bitsandbytes"
+                    )
+                from diffusers import BitsAndBytesConfig as DiffusersBnbConfig
+
+                if quant == "nf4":
+                    quant_config = DiffusersBnbConfig(
+                        load_in_4bit=True,
+                        bnb_4bit_quant_type="nf4",
+                        bnb_4bit_compute_dtype=torch.bfloat16,
+                    )
+                elif quant == "int8":
+                    quant_config = DiffusersBnbConfig(load_in_8bit=True)
+                else:
+                    raise ValueError(f"Unknown quantization: {quant}")
+                print(f"✅ Quantizing UNet + ControlNet to {quant.upper()} (bitsandbytes)")
+        quant_kwargs = {"quantization_config": quant_config} if quant_config is not None else {}
+
+        def unet_override(single_file=None, **pretrained_kwargs):
+            # bitsandbytes quantizes while loading, so the UNet is loaded on its own and handed to the pipeline
+            if quant_config is None:
+                return {}
+            if single_file:
+                unet = UNet2DConditionModel.from_single_file(single_file, torch_dtype=dtype_to_use, **quant_kwargs)
+            else:
+                unet = UNet2DConditionModel.from_pretrained(
+                    subfolder="unet", torch_dtype=dtype_to_use, use_safetensors=True, **quant_kwargs, **pretrained_kwargs
+                )
+            return {"unet": unet}
         
-        cn_path = os.path.join(os.getcwd(), "models", "control_v1p_sd15_qrcode_monster")
-        if not os.path.exists(cn_path):
-             cn_path = "monster-labs/control_v1p_sd15_qrcode_monster" # Fallback to online
-             
+        cn_path, single_file_path, model_id_or_path, variant = self._resolve_model_paths()
+
         controlnet = ControlNetModel.from_pretrained(
             cn_path, 
             torch_dtype=dtype_to_use,
-            use_safetensors=True
+            use_safetensors=True,
+            **quant_kwargs
         )
         
         # 2. Load Stable Diffusion
-        # PRIORITIZE Single File Checkpoint (SafeTensor) if available
-        model_dir = os.path.join(os.getcwd(), "models")
-        sd_path = os.path.join(model_dir, "stable-diffusion-v1-5")
-        
-        single_file_path = None
-        # Look for any .safetensors in models/ that is NOT controlnet
-        if os.path.exists(model_dir):
-            for f in os.listdir(model_dir):
-                if f.endswith(".safetensors") and "control" not in f:
-                    single_file_path = os.path.join(model_dir, f)
-                    print(f"Found single-file model: {single_file_path}")
-                    break
-        
         if single_file_path:
-            # Load from single file (Highest Priority - Root)
             print(f"Loading from Single File: {single_file_path}")
             self.pipe = StableDiffusionControlNetPipeline.from_single_file(
                 single_file_path,
                 controlnet=controlnet,
                 torch_dtype=dtype_to_use,
                 safety_checker=None,
-                use_safetensors=True
+                use_safetensors=True,
+                **unet_override(single_file=single_file_path)
             )
         else:
-            # Check if sd_path (subfolder) contains a single safetensors file
-            # This happens when downloading Realistic Vision via snapshot_download
-            sub_single_file = None
-            if os.path.exists(sd_path):
-                 for f in os.listdir(sd_path):
-                     if f.endswith(".safetensors") and "control" not in f:
-                         sub_single_file = os.path.join(sd_path, f)
-                         break
-            
-            if sub_single_file:
-                 print(f"Loading from Sub-folder Single File: {sub_single_file}")
-                 self.pipe = StableDiffusionControlNetPipeline.from_single_file(
-                    sub_single_file,
-                    controlnet=controlnet,
-                    torch_dtype=dtype_to_use,
-                    safety_checker=None,
-                    use_safetensors=True
-                )
-            else:
-                # Fallback to standard Diffusers folder or online
-                print("Single file not found, checking folder/online...")
-                
-                # Check if local folder has actual Diffusers weights
-                has_local_weights = False
-                if os.path.exists(sd_path):
-                    # Check for bin or safetensors in unet folder
-                    unet_path = os.path.join(sd_path, "unet")
-                    if os.path.exists(unet_path):
-                        if any(f.endswith((".bin", ".safetensors")) for f in os.listdir(unet_path)):
-                            has_local_weights = True
-                
-                if has_local_weights:
-                    model_id_or_path = sd_path
-                    variant = None 
-                else:
-                    model_id_or_path = "runwayml/stable-diffusion-v1-5"
-                    variant = "fp16"
-
-                self.pipe = StableDiffusionControlNetPipeline.from_pretrained(
-                    model_id_or_path,
-                    controlnet=controlnet,
-                    torch_dtype=dtype_to_use,
-                    safety_checker=None,
-                    use_safetensors=True,
-                    variant=variant
-                )
+            self.pipe = StableDiffusionControlNetPipeline.from_pretrained(
+                model_id_or_path,
+                controlnet=controlnet,
+                torch_dtype=dtype_to_use,
+                safety_checker=None,
+                use_safetensors=True,
+                variant=variant,
+                **unet_override(pretrained_model_name_or_path=model_id_or_path, variant=variant)
+            )
         
-        # Use DPM++ 2M Karras scheduler for better quality at low steps
-        self.pipe.scheduler = DPMSolverMultistepScheduler.from_config(self.pipe.scheduler.config, use_karras_sigmas=True)
+        # Use DPM++ 2M Karras scheduler for better quality at low steps (converges in ~20)
+        self.pipe.scheduler = DPMSolverMultistepScheduler.from_config(
+            self.pipe.scheduler.config, algorithm_type="dpmsolver++", use_karras_sigmas=True
+        )
         
         # --- MODE CONFIGURATION ---
         self.pipe.enable_attention_slicing() # Always enable slicing to save RAM
+
+        # DeepCache (opt-in, QR_AI_DEEPCACHE=1) trades some detail for speed. It changes which UNet
+        # blocks run from step to step, so on CUDA it replaces torch.compile / CUDA graphs (both
+        # need one fixed forward) instead of stacking
+        deepcache = os.environ.get("QR_AI_DEEPCACHE") == "1" and self._enable_deepcache()
+        if deepcache:
+            print("✅ DeepCache enabled: deep UNet features reused on 2 of every 3 steps")
         
         if mode == "eco":
             # ECO MODE: Slow but Cool (CPU Offloading)
-            if DEVICE == "mps":
+            if device == "mps":
                 try:
                     self.pipe.enable_model_cpu_offload()
                     print("✅ ECO MODE: Enabled Model CPU Offloading (Cooler, Slower)")
                 except Exception as e:
                     print(f"⚠️ Eco mode failed: {e}")
-                    self.pipe.to(DEVICE)
+                    self.pipe.to(device)
             else:
-                 self.pipe.to(DEVICE)
+                 self.pipe.to(device)
                  
         else: # balanced
             # BALANCED MODE: Fast & Safe (Full GPU + VAE Tiling)
-            self.pipe.to(DEVICE)
-            if DEVICE == "mps":
+            self.pipe.to(device)
+            if device == "mps":
                 try:
                     self.pipe.enable_vae_tiling()
                     print("✅ BALANCED MODE: Enabled VAE Tiling (Fast, Crash-Free)")
                 except Exception as e:
                     print(f"⚠️ VAE Tiling failed: {e}")
+            elif device == "cuda" and quant_config is None and not deepcache:
+                # Fixed 512x512 shapes make the denoising loop a good fit for CUDA graph replay.
+                # Prefer torch.compile (kernel fusion + its own CUDA graphs); hand-captured graphs are the fallback.
+                if self._compile_cuda_modules(dtype_to_use):
+                    print("✅ BALANCED MODE: Compiled UNet + ControlNet (torch.compile)")
+                else:
+                    _enable_unet_cuda_graphs(self.pipe.unet, self._unet_graphs)
+                    print("✅ BALANCED MODE: Enabled UNet CUDA Graphs")
 
         print("AI Models Loaded Successfully!")
 
+    @classmethod
+    def _resolve_model_paths(cls):
+        """Finds which ControlNet / Stable Diffusion weights to load. Scans models/ once per process."""
+        if cls._resolved_model_path is not None:
+            return cls._resolved_model_path
+
+        cn_path = os.path.join(os.getcwd(), "models", "control_v1p_sd15_qrcode_monster")
+        if not os.path.exists(cn_path):
+             cn_path = "monster-labs/control_v1p_sd15_qrcode_monster" # Fallback to online
+
+        # PRIORITIZE Single File Checkpoint (SafeTensor) if available
+        model_dir = os.path.join(os.getcwd(), "models")
+        sd_path = os.path.join(model_dir, "stable-diffusion-v1-5")
+        model_id_or_path = None
+        variant = None
+
+        single_file_path = None
+        # Look for any .safetensors in models/ that is NOT controlnet (Highest Priority - Root)
+        if os.path.exists(model_dir):
+            for f in os.listdir(model_dir):
+                if f.endswith(".safetensors") and "control" not in f:
+                    single_file_path = os.path.join(model_dir, f)
+                    print(f"Found single-file model: {single_file_path}")
+                    break
+
+        # Check if sd_path (subfolder) contains a single safetensors file
+        # This happens when downloading Realistic Vision via snapshot_download
+        if not single_file_path and os.path.exists(sd_path):
+            for f in os.listdir(sd_path):
+                if f.endswith(".safetensors") and "control" not in f:
+                    single_file_path = os.path.join(sd_path, f)
+                    print(f"Found sub-folder single-file model: {single_file_path}")
+                    break
+
+        if not single_file_path:
+            # Fallback to standard Diffusers folder or online
+            print("Single file not found, checking folder/online...")
+
+            # Check if local folder has actual Diffusers weights (bin or safetensors in unet folder)
+            unet_path = os.path.join(sd_path, "unet")
+            if os.path.exists(unet_path) and any(f.endswith((".bin", ".safetensors")) for f in os.listdir(unet_path)):
+                model_id_or_path = sd_path
+            else:
+                model_id_or_path = "runwayml/stable-diffusion-v1-5"
+                variant = "fp16"
+
+        cls._resolved_model_path = (cn_path, single_file_path, model_id_or_path, variant)
+        return cls._resolved_model_path
+
+    def reload_models(self):
+        """Re-scans models/ (e.g. after download_models.py) and reloads on the next generate()."""
+        AI_Generator._resolved_model_path = None
+        self.release()
+
+    def _enable_deepcache(self):
+        """
+        Wraps the pipeline with DeepCache (optional package): the UNet's deep blocks are computed
+        every 3rd step and their features reused in between, cutting most of the per-step UNet cost. Returns False if DeepCache isn't available.
+        """
+        try:
+            from DeepCache import DeepCacheSDHelper
+        except ImportError:
+            print("⚠️ QR_AI_DEEPCACHE=1 but the DeepCache package is not installed, running the full UNet every step")
+            return False
+        try:
+            helper = DeepCacheSDHelper(pipe=self.pipe)
+            helper.set_params(cache_interval=3, cache_branch_id=0)
+            helper.enable()
+        except Exception as e:
+            print(f"⚠️ DeepCache failed, running the full UNet every step: {e}")
+            return False
+        self._deepcache = helper  # keep the helper alive with the pipeline
+        return True
+
+    def _compile_cuda_modules(self, dtype):
+        """
+        Wraps UNet + ControlNet in torch.compile(mode="reduce-overhead") and runs one dummy
+        512x512 step so compilation happens here instead of on the first user request.
+        Restores the eager modules and returns False if compilation isn't available.
+        """
+        import torch
+
+        device = get_device()
+        if not hasattr(torch, "compile"):
+            return False
+        unet, controlnet = self.pipe.unet, self.pipe.controlnet
+        try:
+            self.pipe.unet = torch.compile(unet, mode="reduce-overhead", fullgraph=False)
+            self.pipe.controlnet = torch.compile(controlnet, mode="reduce-overhead", fullgraph=False)
+
+            # Batch of 2 = classifier-free guidance (uncond + cond), 64x64 latents = 512x512 image
+            latents = torch.randn(2, 4, 64, 64, device=device, dtype=dtype)
+            timestep = torch.tensor(999, device=device)
+            text_embeds = torch.randn(2, 77, unet.config.cross_attention_dim, device=device, dtype=dtype)
+            control = torch.rand(2, 3, 512, 512, device=device, dtype=dtype)
+            with torch.no_grad():
+                down, mid = self.pipe.controlnet(
+                    latents, timestep,
+                    encoder_hidden_states=text_embeds,
+                    controlnet_cond=control,
+                    conditioning_scale=1.0,
+                    return_dict=False
+                )
+                self.pipe.unet(
+                    latents, timestep,
+                    encoder_hidden_states=text_embeds,
+                    down_block_additional_residuals=down,
+                    mid_block_additional_residual=mid,
+                    return_dict=False
+                )
+            return True
+        except Exception as e:
+            print(f"⚠️ torch.compile unavailable, using eager modules: {e}")
+            self.pipe.unet, self.pipe.controlnet = unet, controlnet
+            return False
+
+    def batch_limit(self):
+        """How many queued jobs may share one pipeline call (only CUDA has the headroom for it)."""
+        try:
+            return 4 if get_device() == "cuda" else 1
+        except ImportError:
+            return 1  # torch missing: generate() reports the error per job
+
     def generate(self, 
                  control_image: Image.Image, 
                  prompt: str, 
@@ -174,63 +403,114 @@ class AI_Generator:
                  num_inference_steps: int = 10,
                  seed: int = -1,
                  mode: str = "balanced",
+                 quant=None,
                  callback=None):
-        
-        # Cleanup memory before generation
-        gc.collect()
-        if DEVICE == "mps":
-            torch.mps.empty_cache()
+        return self.generate_batch(
+            [control_image], [prompt], [negative_prompt], [seed],
+            controlnet_conditioning_scale=controlnet_conditioning_scale,
+            guidance_scale=guidance_scale,
+            control_guidance_start=control_guidance_start,
+            control_guidance_end=control_guidance_end,
+            num_inference_steps=num_inference_steps,
+            mode=mode,
+            quant=quant,
+            callback=callback,
+        )[0]
+
+    def generate_batch(self,
+                       control_images, prompts, negative_prompts, seeds,
+                       controlnet_conditioning_scale: float = 1.35,
+                       guidance_scale: float = 7.0,
+                       control_guidance_start: float = 0.0,
+                       control_guidance_end: float = 1.0,
+                       num_inference_steps: int = 10,
+                       mode: str = "balanced",
+                       quant=None,
+                       callback=None):
+        """
+        Runs several jobs through one pipeline call; per-job inputs are parallel lists.
+        The remaining settings apply to the whole batch, so callers group jobs that agree on them.
+        Returns one image per job, in order.
+        """
+        import torch
+
+        device = get_device()
 
-        self.load_model(mode=mode)
-        
-        if seed != -1:
-            generator = torch.Generator(device=DEVICE).manual_seed(seed)
-        else:
-            generator = None
-        
         # Ensure control image is appropriate size
         # Reduced to 512x512 to prevent Mac overheating/hang
         width, height = 512, 512
-        control_image = control_image.resize((width, height), Image.Resampling.LANCZOS)
+        images = []
+        for control_image in control_images:
+            if control_image.size != (width, height):
+                # Hard-edged QR content: a 2-tap BILINEAR filter keeps the module edges as well as LANCZOS (6-tap),
+                # and an integer downscale is already pixel-aligned so NEAREST is exact.
+                if control_image.width % width == 0 and control_image.height % height == 0:
+                    resample = Image.Resampling.NEAREST
+                else:
+                    resample = Image.Resampling.BILINEAR
+                control_image = control_image.resize((width, height), resample)
+            images.append(control_image)
         
-        # Run generation
-        try:
-            with torch.no_grad():
-                output = self.pipe(
-                    prompt=prompt,
-                    negative_prompt=negative_prompt,
-                    image=control_image,
-                    width=width,
-                    height=height,
-                    guidance_scale=guidance_scale,
-                    controlnet_conditioning_scale=controlnet_conditioning_scale,
-                    control_guidance_start=control_guidance_start,
-                    control_guidance_end=control_guidance_end,
-                    num_inference_steps=num_inference_steps,
-                    generator=generator,
-                    callback=callback,
-                    callback_steps=1
-                )
-            
-            # Manual post-processing to avoid black image/NaN issues on MPS
-            image_tensor = output.images[0] 
-            
-            # Cleanup memory after generation
-            gc.collect()
-            if DEVICE == "mps":
-                torch.mps.empty_cache()
+        # Run generation. Loading and seeding sit under the same lock: a mode switch can't
+        # replace the pipeline, nor another call reseed the shared generator, while this one runs.
+        with self._pipe_lock, torch.no_grad():
+            self.load_model(mode=mode, quant=quant)
 
-            if isinstance(image_tensor, Image.Image):
-                return image_tensor
-                
-            # If output is tensor (sometimes happens with raw output)
-            return image_tensor
-        except Exception as e:
-            # Emergency cleanup if crash
+            if len(seeds) == 1:
+                if seeds[0] != -1:
+                    # Reuse one generator and just reseed it (creating one per call syncs the device on MPS);
+                    # safe only because the lock keeps other calls from reseeding it mid-run
+                    if self._generator is None:
+                        self._generator = torch.Generator(device=device)
+                    generator = self._generator.manual_seed(seeds[0])
+                else:
+                    generator = None
+            elif all(seed == -1 for seed in seeds):
+                generator = None
+            else:
+                # One generator per image keeps each seeded job reproducible regardless of its batch mates
+                generator = [
+                    torch.Generator(device=device).manual_seed(seed if seed != -1 else random.randrange(2**32))
+                    for seed in seeds
+                ]
+
+            output = self.pipe(
+                prompt=list(prompts),
+                negative_prompt=list(negative_prompts),
+                image=images if len(images) > 1 else images[0],
+                width=width,
+                height=height,
+                guidance_scale=guidance_scale,
+                controlnet_conditioning_scale=controlnet_conditioning_scale,
+                control_guidance_start=control_guidance_start,
+                control_guidance_end=control_guidance_end,
+                num_inference_steps=num_inference_steps,
+                generator=generator,
+                callback=callback,
+                callback_steps=1
+            )
+        
+        return list(output.images)
+
+    def release(self):
+        """Frees the loaded pipeline and returns cached device memory (next generate() reloads)."""
+        with self._pipe_lock:
+            if self.pipe is None:
+                return
+            import torch
+
+            device = get_device()
+            del self.pipe
+            self.pipe = None
+            self.current_mode = None
+            self.current_quant = None
+            self._deepcache = None
+            self._unet_graphs.clear()
             gc.collect()
-            if DEVICE == "mps":
+            if device == "mps":
                 torch.mps.empty_cache()
-            raise e
+            elif device == "cuda":
+                torch.cuda.empty_cache()
 
 # Singleton instance
 ai_engine = AI_Generator()
@@ -0,0 +1,27 @@
+import pytest
+
+from web_app import smart_analyze_prompt
+
+SMOOTH = "Smooth/Adaptive"
+TEXTURED = "Textured/Nature"
+BALANCED = "Balanced/General"
+
+
+@pytest.mark.parametrize("prompt,mode", [
+    # Plurals and compounds of smooth keywords keep the smooth profile
+    ("glasses on a table", SMOOTH),
+    ("buses in city", SMOOTH),
+    ("starship", SMOOTH),
+    ("cloudy mountains", SMOOTH),
+    ("anime girl in jungle", SMOOTH),
+    ("3D render of trees", SMOOTH),
+    ("Stained Glass", SMOOTH),
+    # Texture keywords, including folded plurals
+    ("forest temple", TEXTURED),
+    ("ancient cities at dusk", TEXTURED),
+    ("rocks and cliffs", TEXTURED),
+    ("a cat", BALANCED),
+    ("", BALANCED),
+])
+def test_smart_analyze_prompt(prompt, mode):
+    assert smart_analyze_prompt(prompt)["mode"] == mode
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageEnhance
+
+import qr_ai_art
+
+
+def _photo(seed, size):
+    rng = np.random.default_rng(seed)
+    noise = Image.fromarray(rng.integers(0, 256, (24, 32, 3), dtype=np.uint8))
+    # Upscaled noise: smooth gradients plus hard edges, like a real background
+    return noise.resize(size, Image.BICUBIC)
+
+
+@pytest.mark.parametrize("seed,size", [(0, (97, 131)), (1, (300, 200)), (2, (512, 512))])
+def test_boost_color_contrast_matches_image_enhance(seed, size):
+    img = _photo(seed, size)
+    expected = ImageEnhance.Contrast(ImageEnhance.Color(img).enhance(1.25)).enhance(1.08)
+    got = qr_ai_art._boost_color_contrast(np.asarray(img))
+    # Same fixed-point L conversion and float32 truncating blends as PIL: no tolerance needed
+    np.testing.assert_array_equal(got, np.asarray(expected))
+
+
+def test_boost_color_contrast_extremes():
+    rgb = np.array([[[0, 0, 0], [255, 255, 255], [255, 0, 0], [0, 255, 0]]], dtype=np.uint8)
+    expected = ImageEnhance.Contrast(ImageEnhance.Color(Image.fromarray(rgb)).enhance(1.25)).enhance(1.08)
+    np.testing.assert_array_equal(qr_ai_art._boost_color_contrast(rgb), np.asarray(expected))
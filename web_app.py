@@ -1,31 +1,242 @@
 from __future__ import annotations
 
-import base64
 import io
+import os
 import hashlib
 import threading
+import queue
 import uuid
 import time
 import json
+import re
+import traceback
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
-
-from flask import Flask, request, jsonify, render_template_string
+from typing import NamedTuple
+from functools import lru_cache
+from types import MappingProxyType
+
+import numpy as np
+import qrcode
+try:
+    import orjson  # optional: faster JSON straight to bytes for the progress endpoints
+except ImportError:
+    orjson = None
+from flask import Flask, Response, request, jsonify, send_file
 from PIL import Image
 
+from ai_generator import ai_engine  # cheap: torch/diffusers load on first generate
 from qr_ai_art import Style, _clamp01, _parse_color, generate_art_qr, create_finder_mask
 from PIL import ImageEnhance, ImageChops, ImageFilter
 
-# Simple in-memory cache for generated results
-# Key: Hash of form parameters
-# Value: Base64 string of the generated image
-RESULT_CACHE = {}
+# Simple in-memory cache for generated results (LRU, bounded)
+# Key: result id = BLAKE2b of the sync page's (FormValues, AI fields, upload digest) key
+# (AI results live in TASK_RESULTS below)
+# Value: PNG bytes of the generated image
+RESULT_CACHE = OrderedDict()
+RESULT_CACHE_MAX = 64
+RESULT_CACHE_MAX_BYTES = 256 * 1024 * 1024  # 2048px PNGs can run to several MB each
+_cache_bytes = 0
+_CACHE_LOCK = threading.RLock()
+
+# Finished AI results, kept for as long as their task (swept with it after TASK_TTL) so a
+# task's result_url stays valid even after RESULT_CACHE has evicted the entry
+# Key: task_id
+# Value: PNG bytes
+TASK_RESULTS = {}
 
 # Async Task Store
 # Key: task_id
-# Value: { 'status': 'pending'|'processing'|'completed'|'failed'|'cancelled', 'progress': 0, 'step': 0, 'total': 0, 'result': None, 'error': None }
+# Value: { 'status': 'pending'|'processing'|'completed'|'failed'|'cancelled', 'progress': 0, 'step': 0, 'total': 0, 'result_url': None, 'error': None, 'created': time }
+# Finished tasks are dropped TASK_TTL seconds after creation.
 TASKS = {}
+TASK_TTL = 3600
+_TASKS_LOCK = threading.RLock()
+# One Condition per task (all on _TASKS_LOCK), notified on every update to that task only;
+# its /progress_stream waits on it instead of the client polling
+_TASK_CONDS = {}
+# Futures of tasks whose caller blocks on the result (the sync /generate route); resolved
+# with the PNG bytes, or the error, when the task reaches a final status
+_TASK_FUTURES = {}
+# Each open stream holds a server thread, so it hands over to client polling after this long
+PROGRESS_STREAM_MAX_SECONDS = 120
+
+
+def _json_bytes(obj):
+    return orjson.dumps(obj) if orjson is not None else json.dumps(obj).encode()
+
+
+def _encode_png(img):
+    # zlib level 1: ~5x faster PNG encode than the default 6 for ~20% more bytes
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", compress_level=1)
+    return buf.getvalue()
+
+
+def _cache_get(key):
+    with _CACHE_LOCK:
+        value = RESULT_CACHE.get(key)
+        if value is not None:
+            RESULT_CACHE.move_to_end(key)
+        return value
+
+
+def _cache_put(key, value):
+    global _cache_bytes
+    with _CACHE_LOCK:
+        old = RESULT_CACHE.pop(key, None)
+        if old is not None:
+            _cache_bytes -= len(old)
+        RESULT_CACHE[key] = value
+        _cache_bytes += len(value)
+        # Evict oldest first; the newest entry is always kept
+        while len(RESULT_CACHE) > 1 and (
+            len(RESULT_CACHE) > RESULT_CACHE_MAX or _cache_bytes > RESULT_CACHE_MAX_BYTES
+        ):
+            _, evicted = RESULT_CACHE.popitem(last=False)
+            _cache_bytes -= len(evicted)
+
+
+def _add_task(task_id, state):
+    now = time.time()
+    state['created'] = now
+    with _TASKS_LOCK:
+        # Sweep expired tasks; running ones are left alone since their worker still writes to them
+        expired = [
+            tid for tid, t in TASKS.items()
+            if now - t['created'] > TASK_TTL and t['status'] not in ('pending', 'processing')
+        ]
+        for tid in expired:
+            del TASKS[tid]
+            TASK_RESULTS.pop(tid, None)
+            _TASK_CONDS.pop(tid).notify_all()  # lets a lingering stream see the task is gone
+        TASKS[task_id] = state
+        _TASK_CONDS[task_id] = threading.Condition(_TASKS_LOCK)
+
+
+def _update_task(task_id, **changes):
+    with _TASKS_LOCK:
+        task = TASKS.get(task_id)
+        if task is not None:
+            task.update(changes)
+            _TASK_CONDS[task_id].notify_all()
+            if task['status'] in ('completed', 'failed', 'cancelled') and task_id in _TASK_FUTURES:
+                future = _TASK_FUTURES.pop(task_id)
+                if task['status'] == 'completed':
+                    # The sync page keeps the PNG in RESULT_CACHE under its own id; don't hold a second copy
+                    future.set_result(TASK_RESULTS.pop(task_id))
+                elif task['status'] == 'failed':
+                    future.set_exception(RuntimeError(task['error']))
+                else:
+                    future.set_exception(InterruptedError("Generation Cancelled"))
+
+
+def _task_snapshot(task_id):
+    with _TASKS_LOCK:
+        task = TASKS.get(task_id)
+        return dict(task) if task is not None else None
 
 # --- SMART PROMPT ANALYZER ---
+# KATEGORI 1: HARUS MULUS (Risiko tinggi jika dipaksa ControlNet)
+# Jika ada salah satu kata ini, kita aktifkan Blending 15% agar aman.
+_SMOOTH_KEYWORDS = (
+    # Vehicles
+    "truck", "car", "bus", "train", "plane", "ship", "boat", "yacht", "bike", 
+    "motorcycle", "scooter", "spaceship", "robot", "mech", "cyborg", "machine",
+
+    # People & Characters
+    "face", "portrait", "girl", "boy", "man", "woman", "person", "character", 
+    "anime", "manga", "waifu", "cartoon", "goddess", "warrior", "elf", "princess",
+    "king", "queen", "knight", "human", "body", "skin", "hair",
+
+    # Styles & Materials
+    "vector", "illustration", "flat", "minimalist", "clean", "simple", "3d render", 
+    "smooth", "shiny", "glass", "metal", "plastic", "chrome", "polished", "neon",
+    "gradient", "studio lighting", "soft", "bokeh", "macro", "unreal engine", "blender",
+
+    # Elements
+    "sky", "cloud", "water", "sea", "ocean", "beach", "ice", "snow field", "white background",
+    "space", "galaxy", "stars", "moon", "sun", "sunset", "sunrise"
+)
+
+# KATEGORI 2: TEKSTUR KASAR (Sangat cocok untuk Shadow QR)
+# Ini bisa menelan QR code tanpa blending.
+_TEXTURE_KEYWORDS = (
+    # Nature
+    "jungle", "forest", "tree", "plant", "flower", "leaf", "grass", "garden", "park",
+    "mountain", "rock", "cliff", "canyon", "cave", "desert", "sand", "waterfall", 
+    "volcano", "lava", "fire", "smoke",
+
+    # Architecture
+    "ruins", "ancient", "temple", "castle", "brick", "stone", "wall", "city", 
+    "skyscraper", "building", "house", "village", "street", "bridge", "aerial", "map",
+    "library", "books", "factory", "industrial",
+
+    # Patterns & Art
+    "texture", "pattern", "mosaic", "stained glass", "circuit", "cyberpunk", 
+    "steampunk", "intricate", "detailed", "painting", "oil", "sketch", "drawing",
+    "graffiti", "grunge", "rust", "old", "dirty"
+)
+
+# Strategy profiles returned by smart_analyze_prompt. Shared read-only objects:
+# callers copy before changing anything.
+# HYBRID MODE: Structure 1.70 + Blend 0.15
+# Aman untuk wajah, kendaraan, dan benda licin.
+_CFG_SMOOTH = MappingProxyType({
+    "mode": "Smooth/Adaptive",
+    "cn_scale": 1.70,
+    "blend": 0.15,
+    "contrast": 1.05,
+    "sharpness": 1.15
+})
+
+# SHADOW MODE: Structure 1.65 + Blend 0.00
+# Target: "Perfect Illusion" (Lush Forest Reference)
+# Reduced from 1.85 to 1.65 to allow leaves to grow naturally over the grid
+_CFG_TEXTURED = MappingProxyType({
+    "mode": "Textured/Nature",
+    "cn_scale": 1.65,
+    "blend": 0.00,
+    "contrast": 1.20,
+    "sharpness": 1.50
+})
+
+# BALANCED MDOE
+# Fallback jika prompt tidak spesifik
+_CFG_BALANCED = MappingProxyType({
+    "mode": "Balanced/General",
+    "cn_scale": 1.75,
+    "blend": 0.10,
+    "contrast": 1.10,
+    "sharpness": 1.25
+})
+
+# Smooth keywords keep plain substring matching (safety first: "starship", "cloudy",
+# "glasses" must all still pick the smooth profile), as one compiled alternation.
+# Texture keywords are matched by token-set lookup; its multi-word phrases
+# ("stained glass", ...) go through a second alternation.
+_SMOOTH_RE = re.compile("|".join(re.escape(k) for k in _SMOOTH_KEYWORDS))
+_TEXTURE_TOKENS = frozenset(k for k in _TEXTURE_KEYWORDS if " " not in k)
+_TEXTURE_PHRASES = re.compile(r"\b(?:" + "|".join(re.escape(k) for k in _TEXTURE_KEYWORDS if " " in k) + r")\b")
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _prompt_tokens(p):
+    tokens = set(_TOKEN_RE.findall(p))
+    # Fold plurals so "trees" / "bushes" / "cities" still hit "tree" / "bush" / "city"
+    for t in list(tokens):
+        if len(t) <= 3 or not t.endswith("s"):
+            continue
+        tokens.add(t[:-1])
+        if t.endswith("ies"):
+            tokens.add(t[:-3] + "y")
+        elif t.endswith("es"):
+            tokens.add(t[:-2])
+    return tokens
+
+
+@lru_cache(maxsize=512)
 def smart_analyze_prompt(prompt_text):
     """
     Analyzes the prompt to decide the best strategy:
@@ -36,149 +247,256 @@ def smart_analyze_prompt(prompt_text):
     """
     p = prompt_text.lower()
     
-    # KATEGORI 1: HARUS MULUS (Risiko tinggi jika dipaksa ControlNet)
-    # Jika ada salah satu kata ini, kita aktifkan Blending 15% agar aman.
-    smooth_keywords = [
-        # Vehicles
-        "truck", "car", "bus", "train", "plane", "ship", "boat", "yacht", "bike", 
-        "motorcycle", "scooter", "spaceship", "robot", "mech", "cyborg", "machine",
-        
-        # People & Characters
-        "face", "portrait", "girl", "boy", "man", "woman", "person", "character", 
-        "anime", "manga", "waifu", "cartoon", "goddess", "warrior", "elf", "princess",
-        "king", "queen", "knight", "human", "body", "skin", "hair",
-        
-        # Styles & Materials
-        "vector", "illustration", "flat", "minimalist", "clean", "simple", "3d render", 
-        "smooth", "shiny", "glass", "metal", "plastic", "chrome", "polished", "neon",
-        "gradient", "studio lighting", "soft", "bokeh", "macro", "unreal engine", "blender",
-        
-        # Elements
-        "sky", "cloud", "water", "sea", "ocean", "beach", "ice", "snow field", "white background",
-        "space", "galaxy", "stars", "moon", "sun", "sunset", "sunrise"
-    ]
-    
-    # KATEGORI 2: TEKSTUR KASAR (Sangat cocok untuk Shadow QR)
-    # Ini bisa menelan QR code tanpa blending.
-    texture_keywords = [
-        # Nature
-        "jungle", "forest", "tree", "plant", "flower", "leaf", "grass", "garden", "park",
-        "mountain", "rock", "cliff", "canyon", "cave", "desert", "sand", "waterfall", 
-        "volcano", "lava", "fire", "smoke",
-        
-        # Architecture
-        "ruins", "ancient", "temple", "castle", "brick", "stone", "wall", "city", 
-        "skyscraper", "building", "house", "village", "street", "bridge", "aerial", "map",
-        "library", "books", "factory", "industrial",
-        
-        # Patterns & Art
-        "texture", "pattern", "mosaic", "stained glass", "circuit", "cyberpunk", 
-        "steampunk", "intricate", "detailed", "painting", "oil", "sketch", "drawing",
-        "graffiti", "grunge", "rust", "old", "dirty"
-    ]
-    
-    is_smooth = any(k in p for k in smooth_keywords)
-    is_textured = any(k in p for k in texture_keywords)
+    is_smooth = _SMOOTH_RE.search(p) is not None
+    is_textured = not is_smooth and (
+        not _prompt_tokens(p).isdisjoint(_TEXTURE_TOKENS) or _TEXTURE_PHRASES.search(p) is not None
+    )
     
     # LOGIC PRIORITAS:
     # Keselamatan nomor 1. Jika ada objek halus (misal: "anime girl in jungle"), 
     # kita tetap pilih Mode Halus agar wajahnya tidak rusak.
     
     if is_smooth:
-        # HYBRID MODE: Structure 1.70 + Blend 0.15
-        # Aman untuk wajah, kendaraan, dan benda licin.
-        return {
-            "mode": "Smooth/Adaptive",
-            "cn_scale": 1.70,      
-            "blend": 0.15,         
-            "contrast": 1.05,
-            "sharpness": 1.15
-        }
-        
+        return _CFG_SMOOTH
     elif is_textured:
-        # SHADOW MODE: Structure 1.65 + Blend 0.00
-        # Target: "Perfect Illusion" (Lush Forest Reference)
-        # Reduced from 1.85 to 1.65 to allow leaves to grow naturally over the grid
-        return {
-            "mode": "Textured/Nature",
-            "cn_scale": 1.65,      
-            "blend": 0.00,         
-            "contrast": 1.20,
-            "sharpness": 1.50
-        }
-        
+        return _CFG_TEXTURED
     else:
-        # BALANCED MDOE
-        # Fallback jika prompt tidak spesifik
-        return {
-            "mode": "Balanced/General",
-            "cn_scale": 1.75,
-            "blend": 0.10,         
-            "contrast": 1.10,
-            "sharpness": 1.25
-        }
+        return _CFG_BALANCED
+
+
+# Padding around each finder tile; comfortably past the reach of GaussianBlur(radius=4),
+# so blurring a padded tile gives exactly the same pixels as blurring the whole mask.
+_FINDER_BLUR_PAD = 24
+
+
+def _blur_finder_tiles(alpha):
+    """
+    GaussianBlur(4) of a finder alpha mask, computed only around the three finder squares
+    (the rest of the mask is zero and stays zero).
+    """
+    w, h = alpha.size
+    boxes = []
+    for quadrant in ((0, 0, w // 2, h // 2), (w // 2, 0, w, h // 2), (0, h // 2, w // 2, h)):
+        bbox = alpha.crop(quadrant).getbbox()
+        if bbox:
+            x0, y0 = quadrant[0], quadrant[1]
+            boxes.append((
+                max(0, x0 + bbox[0] - _FINDER_BLUR_PAD), max(0, y0 + bbox[1] - _FINDER_BLUR_PAD),
+                min(w, x0 + bbox[2] + _FINDER_BLUR_PAD), min(h, y0 + bbox[3] + _FINDER_BLUR_PAD),
+            ))
+    
+    # Tiles that overlap would cut each other's blur short: just blur everything then
+    overlapping = any(
+        a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+        for i, a in enumerate(boxes) for b in boxes[i + 1:]
+    )
+    if overlapping or len(boxes) != 3:
+        return alpha.filter(ImageFilter.GaussianBlur(radius=4))
+    
+    blurred = Image.new("L", alpha.size, 0)
+    for box in boxes:
+        blurred.paste(alpha.crop(box).filter(ImageFilter.GaussianBlur(radius=4)), box[:2])
+    return blurred
+
+
+@lru_cache(maxsize=64)
+def _finder_assets(qr_data, size):
+    """
+    Finder-pattern masks for blend_qr_contrast, cached per (qr_data, size).
+    Returns (blurred alpha as uint16 HxWx1, bool HxWx1 of the light finder pixels), both read-only.
+    """
+    finder_img = create_finder_mask(qr_data, size=size, border=0)
+    
+    # Blur the alpha mask to avoid hard edges
+    finder_alpha = _blur_finder_tiles(finder_img.split()[3])
+    
+    finder_alpha = np.asarray(finder_alpha, dtype=np.uint16)[..., None]
+    finder_alpha.flags.writeable = False
+    finder_on = np.asarray(finder_img.convert("L"))[..., None] >= 128
+    finder_on.flags.writeable = False
+    return finder_alpha, finder_on
+
+
+def _add_weighted(a, b, alpha):
+    """Image.blend on uint8 arrays: a + alpha * (b - a), truncated to uint8 the same way."""
+    out = b.astype(np.float32)
+    np.subtract(out, a, out=out)
+    np.multiply(out, np.float32(alpha), out=out)
+    np.add(out, a, out=out)
+    np.clip(out, 0, 255, out=out)
+    return out.astype(np.uint8)
+
+
+def _composite_np(a, b, mask):
+    """
+    Image.composite on uint8 arrays: a where mask is 255, b where it is 0.
+    mask is uint16 (broadcastable to a); rounding matches PIL's paste (DIV255).
+    """
+    out = a.astype(np.uint16)
+    np.multiply(out, mask, out=out)
+    tmp = b.astype(np.uint16)
+    np.multiply(tmp, 255 - mask, out=tmp)
+    np.add(out, tmp, out=out)
+    np.add(out, 128, out=out)
+    np.add(out, out >> 8, out=out)
+    np.right_shift(out, 8, out=out)
+    return out.astype(np.uint8)
+
+
+def _rgb_image(arr):
+    """HxWx3 uint8 array -> RGB image straight from its (C-contiguous) buffer."""
+    arr = np.ascontiguousarray(arr)
+    h, w = arr.shape[:2]
+    return Image.frombuffer("RGB", (w, h), arr, "raw", "RGB", 0, 1)
+
+
+def _contrast_sharpen(img, contrast, sharpness, as_array=False):
+    """
+    ImageEnhance.Contrast(contrast) followed by ImageEnhance.Sharpness(sharpness) in NumPy, reusing
+    one float buffer. Rounding and truncation follow PIL, so the result is identical.
+    as_array=True returns the HxWx3 uint8 array instead of wrapping it in an image.
+    """
+    if img.mode != "RGB":
+        img = ImageEnhance.Contrast(img).enhance(contrast)
+        return ImageEnhance.Sharpness(img).enhance(sharpness)
+
+    arr = np.asarray(img, dtype=np.float32)
+
+    # Contrast: mean + c * (x - mean), around the rounded mean of the "L" conversion
+    mean = np.float32(int(np.asarray(img.convert("L")).mean() + 0.5))
+    arr -= mean
+    arr *= np.float32(contrast)
+    arr += mean
+    np.clip(arr, 0, 255, out=arr)
+    contrasted = arr.astype(np.uint8)  # truncates, like Image.blend
+
+    # Sharpness: smooth + s * (x - smooth), where smooth is ImageFilter.SMOOTH
+    # (3x3 kernel [1 1 1; 1 5 1; 1 1 1] / 13, rounded; the 1px border is left as is).
+    # Done in exact integers: round((3x3 box sum + 4 * centre) / 13). A .5 tie can't occur.
+    c16 = contrasted.astype(np.uint16)
+    rows = c16[:, :-2] + c16[:, 1:-1]
+    rows += c16[:, 2:]
+    box = rows[:-2] + rows[1:-1]
+    box += rows[2:]
+    box += c16[1:-1, 1:-1] * 4
+    box *= 2
+    box += 13
+    box //= 26
+    smooth = contrasted.astype(np.float32)
+    smooth[1:-1, 1:-1] = box
+
+    np.copyto(arr, contrasted)
+    arr -= smooth
+    arr *= np.float32(sharpness)
+    arr += smooth
+    np.clip(arr, 0, 255, out=arr)
+    out = arr.astype(np.uint8)
+    return out if as_array else _rgb_image(out)
+
 
 def blend_qr_contrast(ai_image, control_image, qr_data, opacity=0.35):
     """
     Subtly enforces the QR structure by burning shadows and dodging highlights.
     Opacity controls the strength of the enforcement.
+    ai_image may be an RGB image or an HxWx3 uint8 array, control_image an image or an HxW
+    uint8 luminance array; an array ai_image gets an array back, so chained NumPy steps skip PIL.
     """
+    as_array = isinstance(ai_image, np.ndarray)
+    ai_u8 = ai_image if as_array else np.asarray(ai_image)
+    h, w = ai_u8.shape[:2]
+
     # 1. Resize control to match AI image
-    control = control_image.resize(ai_image.size, Image.Resampling.NEAREST).convert("L")
+    # Threshold the small control image first; an integer-ratio NEAREST upscale is then just np.repeat.
+    control_l = control_image if isinstance(control_image, np.ndarray) else np.asarray(control_image.convert("L"))
+    ch, cw = control_l.shape
+    if w % cw == 0 and h % ch == 0:
+        control_on = control_l >= 128
+        control_on = np.repeat(np.repeat(control_on, h // ch, axis=0), w // cw, axis=1)
+    else:
+        control_on = np.asarray(Image.fromarray(control_l).resize((w, h), Image.Resampling.NEAREST)) >= 128
+    control_on = control_on[..., None]
+    
+    # All brightness layers are scalar multiples of the same pixels, so they
+    # share one float view of the image and one scratch buffer.
+    # (uint8 cast truncates, same as ImageEnhance.Brightness)
+    ai_f = ai_u8.astype(np.float32)
+    scratch = np.empty_like(ai_f)
+
+    def _brightness(factor):
+        np.multiply(ai_f, factor, out=scratch)
+        np.clip(scratch, 0, 255, out=scratch)
+        return scratch.astype(np.uint8)
     
-    # 2. Create Shadow Layer (Darken original)
+    # 2. Shadow gain (Darken original)
     # Stronger effect = darker shadows
     shadow_factor = 0.4 - (opacity * 0.2) # 0.4 to 0.2
-    shadow_layer = ImageEnhance.Brightness(ai_image).enhance(max(0.1, shadow_factor))
     
-    # 3. Create Highlight Layer (Brighten original)
+    # 3. Highlight gain (Brighten original)
     # Stronger effect = brighter highlights
     highlight_factor = 1.0 + (opacity * 0.8) # 1.0 to 1.8
-    highlight_layer = ImageEnhance.Brightness(ai_image).enhance(highlight_factor)
     
-    # 4. Composite Global (Data Modules)
+    # 4+5. Composite Global (Data Modules) and blend it over the original in one pass:
+    # out = ai + opacity * (layer - ai), where layer = ai * (highlight if mask is white else shadow).
     # Mask 0 (Black) -> Shadow. Mask 255 (White) -> Highlight.
-    global_contrast = Image.composite(highlight_layer, shadow_layer, control)
-    
-    # 5. Blend Global: Apply opacity to data
-    blended = Image.blend(ai_image, global_contrast, opacity)
+    gain = np.where(control_on, np.float32(highlight_factor), np.float32(max(0.1, shadow_factor)))
+    out = np.multiply(ai_f, gain)
+    np.clip(out, 0, 255, out=out)
+    np.floor(out, out=out)  # the layer itself is 8-bit in PIL
+    np.subtract(out, ai_f, out=out)
+    np.multiply(out, np.float32(opacity), out=out)
+    np.add(out, ai_f, out=out)
+    np.clip(out, 0, 255, out=out)
+    blended_u8 = out.astype(np.uint8)
     
     # 6. Special Handling for Finder Patterns (The 3 big squares)
     try:
-        w, h = ai_image.size
         # CRITICAL FIX: Border must match the generator's border (0)
         # Otherwise the blend mask will be misaligned with the AI structure!
-        finder_img = create_finder_mask(qr_data, size=w, border=0)
-        finder_alpha = finder_img.split()[3]
-        
-        # Blur the alpha mask to avoid hard edges
-        finder_alpha = finder_alpha.filter(ImageFilter.GaussianBlur(radius=4))
-        
-        finder_pattern = finder_img.convert("L")
+        finder_alpha, finder_on = _finder_assets(qr_data, w)
         
         # Finder Contrast: Usually stronger than global
-        deep_shadow = ImageEnhance.Brightness(ai_image).enhance(max(0.05, shadow_factor - 0.1))
-        bright_highlight = ImageEnhance.Brightness(ai_image).enhance(highlight_factor + 0.2)
+        deep_shadow = _brightness(max(0.05, shadow_factor - 0.1))
+        bright_highlight = _brightness(highlight_factor + 0.2)
         
-        finder_contrast = Image.composite(bright_highlight, deep_shadow, finder_pattern)
+        finder_contrast = np.where(finder_on, bright_highlight, deep_shadow)
         
         # Blend finders slightly stronger than global, BUT respect the base opacity!
         # If opacity is 0.0 (Hidden), finder opacity should also be very low/zero
         # to avoid ugly box artifacts. We trust the ControlNet 1.95 to structure it instead.
         finder_opacity = min(1.0, opacity + 0.15) if opacity > 0 else 0.0
         
-        final_finders = Image.blend(blended, finder_contrast, finder_opacity)
+        final_finders = _add_weighted(blended_u8, finder_contrast, finder_opacity)
         
-        final_output = Image.composite(final_finders, blended, finder_alpha)
-        
-        return final_output
+        final_output = _composite_np(final_finders, blended_u8, finder_alpha)
         
     except Exception as e:
         print(f"Finder enhancement failed: {e}")
-        return blended
+        final_output = blended_u8
+
+    return final_output if as_array else _rgb_image(final_output)
+
+
+@lru_cache(maxsize=128)
+def _control_image(data):
+    """
+    ControlNet input for the AI modes: the QR for `data` (ECC H, 10px modules), cached per payload.
+    The image is shared between requests: only read from it.
+    """
+    # CRITICAL FIX: Border=0 to prevent "white box" overlay effect!
+    # We want the QR pattern to fill the canvas naturally (Full Bleed)
+    qr = qrcode.QRCode(
+        version=None,
+        error_correction=qrcode.constants.ERROR_CORRECT_H,
+        box_size=10,
+        border=0,  # ZER0 BORDER = NO BOX ARTIFACTS!
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    
+    return qr.make_image(fill_color="black", back_color="white").convert("RGB")
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class FormValues:
     data: str
     size: int
@@ -546,6 +864,22 @@ _PAGE = """<!doctype html>
       
       .collapsible-content {
         margin-top: 12px;
+        display: none;
+      }
+      
+      /* Open state lives in one class on the section: content shows, arrow rotates (composited) */
+      .collapsible.open > .collapsible-content {
+        display: block;
+      }
+      
+      .collapsible-header .arrow {
+        display: inline-block;
+        transition: transform 0.15s ease;
+        will-change: transform;
+      }
+      
+      .collapsible.open > .collapsible-header .arrow {
+        transform: rotate(90deg);
       }
       
       /* LOADING OVERLAY */
@@ -596,8 +930,12 @@ _PAGE = """<!doctype html>
       .progress-bar { 
         height: 100%; 
         background: linear-gradient(90deg, var(--accent), #6b8fff); 
-        width: 0%; 
-        transition: width 0.3s ease; 
+        width: 100%; 
+        /* scaleX is composited: no layout pass per progress update */
+        transform-origin: left; 
+        transform: scaleX(0); 
+        will-change: transform; 
+        transition: transform 0.3s ease; 
       }
       
       .cancel-btn { 
@@ -652,7 +990,7 @@ _PAGE = """<!doctype html>
     </style>
     <script>
         let currentTaskId = null;
-        let pollInterval = null;
+        let progressStream = null;
 
         function setMode(mode) {
             document.getElementById('mode-input').value = mode;
@@ -680,7 +1018,7 @@ _PAGE = """<!doctype html>
                 document.getElementById('loading-overlay').style.display = 'flex';
                 document.getElementById('loading-status').innerText = "Initializing AI...";
                 document.getElementById('loading-sub').innerText = "Starting engine...";
-                document.getElementById('progress-bar').style.width = '0%';
+                document.getElementById('progress-bar').style.transform = 'scaleX(0)';
                 document.getElementById('cancel-btn').style.display = 'block';
                 document.getElementById('classic-spinner').style.display = 'none'; // Hide spinner for progress bar focus
                 document.getElementById('progress-container').style.display = 'block';
@@ -705,7 +1043,7 @@ _PAGE = """<!doctype html>
                     if (data.error) throw new Error(data.error);
                     
                     currentTaskId = data.task_id;
-                    pollProgress(currentTaskId);
+                    watchProgress(currentTaskId);
                     
                 } catch (e) {
                     alert("Error: " + e.message);
@@ -717,52 +1055,113 @@ _PAGE = """<!doctype html>
             }
         }
 
-        async function pollProgress(taskId) {
-            if(pollInterval) clearInterval(pollInterval);
+        // Result images are only kept for a while on the server
+        function resultExpired() {
+            document.querySelector('.imgbox').innerHTML =
+                '<div class="foot" style="padding: 40px 20px;">This result has expired. Please generate it again.</div>';
+            document.querySelectorAll('.preview .dl').forEach(dl => dl.remove());
+        }
+
+        // Returns true once the task has reached a final state
+        function handleProgress(taskId, data) {
+            if (data.status === 'completed') {
+                // Update Image
+                const imgBox = document.querySelector('.imgbox');
+                imgBox.innerHTML = `<img src="${data.result_url}" alt="Result" onerror="resultExpired()" />`;
+                
+                // Add Download Button (Fix for missing button)
+                // Remove existing download buttons if any to avoid duplicates
+                const existingBtn = document.getElementById('dl-btn-container');
+                if(existingBtn) existingBtn.remove();
+
+                const dlDiv = document.createElement('div');
+                dlDiv.id = 'dl-btn-container';
+                dlDiv.style.cssText = "display:flex; gap:10px; justify-content:center; margin-top:12px;";
+                dlDiv.innerHTML = `<a href="${data.result_url}" download="qr_art_${taskId}.png" class="dl">⬇️ Download PNG</a>`;
+                
+                // Append after imgbox
+                imgBox.parentNode.appendChild(dlDiv);
+                
+                hideLoading();
+                return true;
+            } else if (data.status === 'failed') {
+                alert("Generation Failed: " + data.error);
+                hideLoading();
+                return true;
+            } else if (data.status === 'cancelled') {
+                hideLoading();
+                return true;
+            }
+            // Update Progress (style writes batched into the next paint)
+            const pct = data.progress + '%';
+            requestAnimationFrame(() => {
+                document.getElementById('progress-bar').style.transform = 'scaleX(' + data.progress / 100 + ')';
+                document.getElementById('loading-status').innerText = `Generating Step ${data.step}/${data.total}`;
+                document.getElementById('loading-sub').innerText = `${pct} Complete`;
+            });
+            return false;
+        }
+
+        function watchProgress(taskId) {
+            if(progressStream) progressStream.close();
             
-            pollInterval = setInterval(async () => {
+            if (!window.EventSource) {
+                pollProgress(taskId);
+                return;
+            }
+            // Server pushes an event whenever the task changes (no polling)
+            progressStream = new EventSource('/progress_stream/' + taskId);
+            progressStream.onerror = (e) => {
+                console.error(e);
+                // Stream dropped for good (proxy, server restart): fall back to polling
+                if (progressStream.readyState === EventSource.CLOSED && currentTaskId === taskId) {
+                    pollProgress(taskId);
+                }
+            };
+            progressStream.onmessage = (ev) => {
+                if (handleProgress(taskId, JSON.parse(ev.data))) progressStream.close();
+            };
+            // Server ends long streams to free its thread: carry on with backoff polling
+            progressStream.addEventListener('poll', () => {
+                progressStream.close();
+                if (currentTaskId === taskId) pollProgress(taskId);
+            });
+        }
+
+        // Fallback: poll /progress, backing off while nothing changes
+        // and idling while the tab is hidden
+        function pollProgress(taskId) {
+            let delay = 500;
+            let lastProgress = null;
+
+            async function poll() {
+                if (currentTaskId !== taskId) return;
+                if (document.hidden) {
+                    document.addEventListener('visibilitychange', poll, { once: true });
+                    return;
+                }
                 try {
                     const res = await fetch('/progress/' + taskId);
                     const data = await res.json();
-                    
-                    if (data.status === 'completed') {
-                        clearInterval(pollInterval);
-                        // Update Image
-                        const imgBox = document.querySelector('.imgbox');
-                        imgBox.innerHTML = `<img src="data:image/png;base64,${data.result}" alt="Result" />`;
-                        
-                        // Add Download Button (Fix for missing button)
-                        // Remove existing download buttons if any to avoid duplicates
-                        const existingBtn = document.getElementById('dl-btn-container');
-                        if(existingBtn) existingBtn.remove();
-
-                        const dlDiv = document.createElement('div');
-                        dlDiv.id = 'dl-btn-container';
-                        dlDiv.style.cssText = "display:flex; gap:10px; justify-content:center; margin-top:12px;";
-                        dlDiv.innerHTML = `<a href="data:image/png;base64,${data.result}" download="qr_art_${data.task_id}.png" class="dl">⬇️ Download PNG</a>`;
-                        
-                        // Append after imgbox
-                        imgBox.parentNode.appendChild(dlDiv);
-                        
-                        hideLoading();
-                    } else if (data.status === 'failed') {
-                        clearInterval(pollInterval);
-                        alert("Generation Failed: " + data.error);
+                    if (!res.ok) {
+                        alert("Error: " + data.error);
                         hideLoading();
-                    } else if (data.status === 'cancelled') {
-                         clearInterval(pollInterval);
-                         hideLoading();
+                        return;
+                    }
+                    if (handleProgress(taskId, data)) return;
+                    if (data.progress === lastProgress) {
+                        delay = Math.min(delay * 1.5, 3000);
                     } else {
-                        // Update Progress
-                        const pct = data.progress + '%';
-                        document.getElementById('progress-bar').style.width = pct;
-                        document.getElementById('loading-status').innerText = `Generating Step ${data.step}/${data.total}`;
-                        document.getElementById('loading-sub').innerText = `${pct} Complete`;
+                        delay = 500;
+                        lastProgress = data.progress;
                     }
                 } catch (e) {
                     console.error(e);
+                    delay = Math.min(delay * 1.5, 3000);
                 }
-            }, 1000);
+                setTimeout(poll, delay);
+            }
+            poll();
         }
 
         async function cancelGeneration() {
@@ -775,7 +1174,8 @@ _PAGE = """<!doctype html>
 
         function hideLoading() {
             document.getElementById('loading-overlay').style.display = 'none';
-            if(pollInterval) clearInterval(pollInterval);
+            if(progressStream) progressStream.close();
+            currentTaskId = null;
         }
 
         function showLoading() {
@@ -856,12 +1256,10 @@ _PAGE = """<!doctype html>
         // STYLE CARD SELECTION
         function selectStyle(styleName) {
             // Update radio button
-            document.querySelectorAll('.style-card').forEach(card => {
-                card.classList.remove('active');
-            });
-            
             const selectedCard = document.querySelector(`[data-style="${styleName}"]`);
             if (selectedCard) {
+                const activeCard = document.querySelector('.style-card.active');
+                if (activeCard && activeCard !== selectedCard) activeCard.classList.remove('active');
                 selectedCard.classList.add('active');
                 // Also check the radio button
                 selectedCard.querySelector('input[type="radio"]').checked = true;
@@ -880,21 +1278,22 @@ _PAGE = """<!doctype html>
 
         // COLLAPSIBLE TOGGLE
         function toggleCollapsible(id) {
-            const content = document.getElementById(id);
-            const header = content.previousElementSibling;
-            const arrow = header.querySelector('.arrow');
-            
-            if (content.style.display === 'none' || content.style.display === '') {
-                content.style.display = 'block';
-                if (arrow) arrow.textContent = '▼';
-            } else {
-                content.style.display = 'none';
-                if (arrow) arrow.textContent = '▶';
-            }
+            // Visibility and arrow rotation are both CSS rules on .collapsible.open
+            document.getElementById(id).parentElement.classList.toggle('open');
         }
 
         // Initialize style cards on load
         window.addEventListener('DOMContentLoaded', function() {
+            // One delegated listener per group instead of an onclick per card
+            document.querySelector('.style-selector').addEventListener('click', e => {
+                const card = e.target.closest('.style-card');
+                if (card) selectStyle(card.dataset.style);
+            });
+            document.querySelector('.presets').addEventListener('click', e => {
+                const btn = e.target.closest('.pset');
+                if (btn) setPreset(btn.dataset.preset);
+            });
+
             // Set default active style
             const defaultStyle = document.querySelector('input[name="readability"]:checked');
             if (defaultStyle) {
@@ -950,26 +1349,26 @@ _PAGE = """<!doctype html>
                     <span style="font-weight: 500; font-size: 14px;">🛠️ Manual Tuning (Advanced)</span>
                 </div>
                 
-                <div id="pro-controls" class="collapsible-content" style="display: none; padding-top: 15px;">
+                <div id="pro-controls" class="collapsible-content" style="padding-top: 15px;">
                     
                     <!-- STYLE SELECTOR (Moved to Pro) -->
                     <label>Scan Strategy</label>
                     <div class="style-selector">
-                        <div class="style-card active" data-style="hidden" onclick="selectStyle('hidden')">
+                        <div class="style-card active" data-style="hidden">
                             <input type="radio" name="readability" value="hidden" checked>
                             <span class="icon">✨</span>
                             <div class="title">Smart Auto</div>
                             <div class="desc">AI adapts to prompt</div>
                         </div>
                         
-                        <div class="style-card" data-style="balanced" onclick="selectStyle('balanced')">
+                        <div class="style-card" data-style="balanced">
                             <input type="radio" name="readability" value="balanced" {% if readability == 'balanced' %}checked{% endif %}>
                             <span class="icon">⚖️</span>
                             <div class="title">Balanced</div>
                             <div class="desc">Standard Control</div>
                         </div>
                         
-                        <div class="style-card" data-style="scannable" onclick="selectStyle('scannable')">
+                        <div class="style-card" data-style="scannable">
                             <input type="radio" name="readability" value="scannable" {% if readability == 'scannable' %}checked{% endif %}>
                             <span class="icon">📱</span>
                             <div class="title">Max Scan</div>
@@ -1023,9 +1422,9 @@ _PAGE = """<!doctype html>
             <div id="classic-controls" style="display:none;">
                 <div class="section-header">Step 2: Choose Preset</div>
                 <div class="presets">
-                  <div class="pset" onclick="setPreset('forest')">🌲 Forest</div>
-                  <div class="pset" onclick="setPreset('city')">🏙️ City</div>
-                  <div class="pset" onclick="setPreset('sharp')">⬛ Sharp</div>
+                  <div class="pset" data-preset="forest">🌲 Forest</div>
+                  <div class="pset" data-preset="city">🏙️ City</div>
+                  <div class="pset" data-preset="sharp">⬛ Sharp</div>
                 </div>
 
                 <div class="section-header">Step 3: Upload Background</div>
@@ -1041,7 +1440,7 @@ _PAGE = """<!doctype html>
                     <div class="collapsible-header" onclick="toggleCollapsible('advanced-classic-settings')">
                         <span class="arrow">▶</span> Advanced Settings
                     </div>
-                    <div id="advanced-classic-settings" class="collapsible-content" style="display: none;">
+                    <div id="advanced-classic-settings" class="collapsible-content">
                         <div class="row">
                           <div>
                             <label>Dark Alpha</label>
@@ -1088,8 +1487,8 @@ _PAGE = """<!doctype html>
         
         <div class="card preview">
           <div class="imgbox">
-            {% if img_data %}
-              <img alt="QR Art Result" src="data:image/png;base64,{{img_data}}" />
+            {% if img_url %}
+              <img alt="QR Art Result" src="{{img_url}}" onerror="resultExpired()" />
             {% else %}
               <div class="foot" style="padding: 40px 20px;">
                 <div style="font-size: 48px; margin-bottom: 16px;">🖼️</div>
@@ -1098,8 +1497,8 @@ _PAGE = """<!doctype html>
               </div>
             {% endif %}
           </div>
-          {% if img_data %}
-            <a class="dl" download="qr-art.png" href="data:image/png;base64,{{img_data}}">⬇️ Download PNG</a>
+          {% if img_url %}
+            <a class="dl" download="qr-art.png" href="{{img_url}}">⬇️ Download PNG</a>
           {% endif %}
         </div>
       </div>
@@ -1109,67 +1508,54 @@ _PAGE = """<!doctype html>
 </html>
 """
 
+# Compiled once; render_template_string would re-parse and re-compile _PAGE on every request.
+# Same environment (and autoescaping) as render_template_string.
+_PAGE_TEMPLATE = app.jinja_env.from_string(_PAGE)
+
+# (field, converter, default) for the plain FormValues fields.
+# A missing or empty form field falls back to the default.
+_FIELD_SPEC = (
+    ("data", str.strip, ""),
+    ("size", int, 1024),
+    ("border", int, 4),
+    ("dark", str.strip, "#000000"),
+    ("light", str.strip, "#ffffff"),
+    ("dark_alpha", float, 0.42),
+    ("light_alpha", float, 0.06),
+    ("rounded", int, 44),
+    ("strength", float, 1.0),
+    ("texture", float, 0.85),
+    ("guidance_scale", float, 7.5),
+    ("control_end", float, 1.0),
+)
+
 def _get_form_values() -> FormValues:
-    data = (request.form.get("data") or "").strip()
-    size = int(request.form.get("size") or 1024)
-    border = int(request.form.get("border") or 4)
-    dark = (request.form.get("dark") or "#000000").strip()
-    light = (request.form.get("light") or "#ffffff").strip()
-    dark_alpha = float(request.form.get("dark_alpha") or 0.42)
-    light_alpha = float(request.form.get("light_alpha") or 0.06)
-    rounded = int(request.form.get("rounded") or 44)
-    strength = float(request.form.get("strength") or 1.0)
-    texture = float(request.form.get("texture") or 0.85)
+    form = request.form
+    fields = {name: conv(form.get(name) or default) for name, conv, default in _FIELD_SPEC}
     
     # Check mode
-    mode = request.form.get("mode") or "organic"
-    if mode not in ['ai', 'organic', 'sharp']:
+    mode = form.get("mode") or "organic"
+    if mode not in ('ai', 'organic', 'sharp'):
          # Fallback for classic dropdown
-         mode = request.form.get("classic_mode") or "organic"
+         mode = form.get("classic_mode") or "organic"
 
-    preserve_finders = bool(request.form.get("preserve_finders"))
-    
-    # AI Params
-    prompt = request.form.get("prompt")
-    negative_prompt = request.form.get("negative_prompt")
-    cn_scale = float(request.form.get("cn_scale") or 1.35)
-    
-    guidance_scale = float(request.form.get("guidance_scale") or 7.5)
-    control_end = float(request.form.get("control_end") or 1.0)
-    
-    # Hack: return extended values object or just access request directly in generate
-    # For now we attach them to the existing object structure by monkeypatching or just relying on request in generate()
-    # Let's keep the FormValues clean and handle AI params separately in generate()
-    
+    # AI prompt params are read separately by the AI routes
     return FormValues(
-        data=data,
-        size=size,
-        border=border,
-        dark=dark,
-        light=light,
-        dark_alpha=dark_alpha,
-        light_alpha=light_alpha,
-        rounded=rounded,
-        preserve_finders=preserve_finders,
-        strength=strength,
-        texture=texture,
+        **fields,
         mode=mode,
-        readability=request.form.get("readability", "balanced"),
-        guidance_scale=guidance_scale,
-        control_end=control_end,
+        preserve_finders=bool(form.get("preserve_finders")),
+        readability=form.get("readability", "balanced"),
     )
 
-def _render_page(*, values: FormValues, img_data: str | None, error: str | None) -> str:
-    from flask import render_template_string
-    
+def _render_page(*, values: FormValues, img_url: str | None, error: str | None) -> str:
     # Get AI params from request if available to repopulate form
-    prompt = request.form.get("prompt", "")
-    negative_prompt = request.form.get("negative_prompt", "ugly, blurry, low quality")
-    cn_scale = request.form.get("cn_scale", 1.35)
-    performance_mode = request.form.get("performance_mode", "balanced")
+    form = request.form
+    prompt = form.get("prompt", "")
+    negative_prompt = form.get("negative_prompt", "ugly, blurry, low quality")
+    cn_scale = form.get("cn_scale", 1.35)
+    performance_mode = form.get("performance_mode", "balanced")
 
-    return render_template_string(
-        _PAGE,
+    return _PAGE_TEMPLATE.render(
         data=values.data,
         size=values.size,
         border=values.border,
@@ -1187,173 +1573,336 @@ def _render_page(*, values: FormValues, img_data: str | None, error: str | None)
         negative_prompt=negative_prompt,
         cn_scale=cn_scale,
         performance_mode=performance_mode,
-        img_data=img_data,
+        img_url=img_url,
         error=error,
     )
 
 
-def run_ai_task(task_id, values, prompt, negative_prompt, cn_scale, seed_val, performance_mode, guidance_scale, control_end):
-    try:
-        import qrcode
-        from ai_generator import ai_engine
+# --- MAGIC PROMPT FOR REALISM ---
+_MAGIC_SUFFIXES = (
+    "raw photo", "photorealistic", "8k uhd", "dslr", "soft lighting", 
+    "high quality", "film grain", "Fujifilm XT3", "intricate details"
+)
+# One case-insensitive scan finds every suffix already in the prompt (lookahead: overlaps count too)
+_MAGIC_RE = re.compile("(?=(" + "|".join(re.escape(m) for m in _MAGIC_SUFFIXES) + "))", re.IGNORECASE)
+
+# --- MAGIC NEGATIVE PROMPT ---
+# Strong anti-cartoon protection (pre-joined)
+_ANTI_CARTOON = ", ".join((
+    "(deformed, distorted, disfigured:1.3)", "poorly drawn", "bad anatomy", "wrong anatomy", 
+    "extra limb", "missing limb", "floating limbs", "(mutated hands and fingers:1.4)", 
+    "disconnected limbs", "mutation", "mutated", "ugly", "disgusting", "blurry", "amputation", 
+    "(cartoon, anime, 3d, painting, drawing, illustration, sketch, flat, vector art:1.2)",
+    "bad quality", "low quality", "jpeg artifacts"
+))
+
+# Hidden mode: keep the QR from reading as a visible grid (pre-joined)
+_ANTI_OBVIOUS = ", ".join((
+    "obvious grid", "regular squares", "artificial pattern", 
+    "computer generated grid", "barcode appearance", "border", "frame", "flat lighting", "low contrast"
+))
+
+
+def _with_magic_suffixes(prompt):
+    # Only append if not already present
+    present = {m.group(1).lower() for m in _MAGIC_RE.finditer(prompt)}
+    to_append = [m for m in _MAGIC_SUFFIXES if m.lower() not in present]
+    if to_append:
+        prompt = f"{prompt}, {', '.join(to_append)}"
+    return prompt
+
+
+def _with_anti_cartoon(negative_prompt):
+    return f"{negative_prompt}, {_ANTI_CARTOON}" if negative_prompt else _ANTI_CARTOON
+
+
+class PromptSpec(NamedTuple):
+    """Final prompts plus generation / post-processing settings for one AI job."""
+    prompt: str
+    negative_prompt: str
+    cn_scale: float
+    control_end: float
+    blend_opacity: float
+    steps: int
+    contrast: float
+    sharpness: float
+
+
+# readability -> (control_end, blend_opacity, steps); a None blend comes from smart_analyze_prompt.
+# DPM++ 2M Karras converges in ~20 steps; hidden mode keeps more for the fine shadow structure.
+_READABILITY_PROFILES = MappingProxyType({
+    'hidden': (1.0, None, 40),
+    'scannable': (1.0, 0.60, 20),  # Standard strong mode with helper blending
+    'balanced': (1.0, 0.20, 20),
+})
+
+
+def _prepare_ai_prompts(values, prompt, negative_prompt, cn_scale):
+    """
+    Readability strategy + prompt augmentation, shared by the async task and the sync /generate route.
+    """
+    # Unknown values fall back to balanced (the default)
+    control_end_final, blend_opacity, steps = _READABILITY_PROFILES.get(
+        values.readability, _READABILITY_PROFILES['balanced'])
+    cn_scale_final = cn_scale
+    
+    # Context for Post-Processing
+    smart_contrast = 1.0
+    smart_sharpness = 1.0
+
+    if blend_opacity is None:
+        # HIDDEN MODE STRATEGY: SMART ADAPTIVE SHADOW ART
         
-        print(f"Starting Task {task_id}")
-
-        # 1. Generate Control Image
-        # CRITICAL FIX: Border=0 for Full Bleed Natural QR
-        qr = qrcode.QRCode(
-            version=None,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,
-            box_size=10,
-            border=0,  # ZER0 BORDER!
-        )
-        qr.add_data(values.data)
-        qr.make(fit=True)
+        # Analyze the user's own prompt (the magic suffixes added below would always read as "smooth")
+        smart_settings = smart_analyze_prompt(prompt)
+        print(f"[{threading.current_thread().name}] Smart Analysis: {smart_settings['mode']} (CN: {smart_settings['cn_scale']})")
         
-        control_image = qr.make_image(fill_color="black", back_color="white").convert("RGB")
+        # Logic: If user kept default (1.35), use SMART value. If user changed it, trust user.
+        if cn_scale == 1.35:
+             cn_scale_final = smart_settings['cn_scale']
+        else:
+             cn_scale_final = cn_scale # User manual override
+        
+        # Post-Processing Values from Smart Analysis
+        smart_contrast = smart_settings['contrast']
+        smart_sharpness = smart_settings['sharpness']
 
-        # 2. Determine parameters based on readability mode (SAME AS SYNC ENDPOINT)
-        # Use the value sent by frontend (which is now auto-updated by JS)
-        cn_scale_final = cn_scale
-        control_end_final = 1.0
+        # Use SMART Blend (No longer hardcoded 0.0)
+        # This allows micro-blending (0.15) for smooth subjects
+        blend_opacity = smart_settings.get('blend', 0.0)
         
-        # Context for Post-Processing
-        smart_contrast = 1.0
-        smart_sharpness = 1.0
+        # INJECT LIGHTING & TEXTURE PROMPTS (CONCISE to avoid CLIP truncation)
+        # If it's a "Nature" mode from Smart Analysis, force LUSH visuals
+        if smart_settings['mode'] == "Textured/Nature":
+             nature_boost = "lush foliage, dense vegetation, organic texture"
+             prompt = f"{prompt}, {nature_boost}"
+        
+        # General Lighting Boost for Scannability (SHORT KEYWORDS ONLY)
+        lighting_boost = "high contrast, deep shadows, chiaroscuro"
+        prompt = f"{prompt}, {lighting_boost}"
 
-        if values.readability == 'hidden':
-            # HIDDEN MODE STRATEGY: SMART ADAPTIVE SHADOW ART
-            
-            # Analyze Prompt
-            smart_settings = smart_analyze_prompt(prompt)
-            print(f"[{task_id}] Smart Analysis: {smart_settings['mode']} (CN: {smart_settings['cn_scale']})")
-            
-            # Logic: If user kept default (1.35), use SMART value. If user changed it, trust user.
-            if cn_scale == 1.35:
-                 cn_scale_final = smart_settings['cn_scale']
-            else:
-                 cn_scale_final = cn_scale # User manual override
-            
-            # Save for later
-            smart_contrast = smart_settings['contrast']
-            smart_sharpness = smart_settings['sharpness']
+        negative_prompt = f"{negative_prompt}, {_ANTI_OBVIOUS}" if negative_prompt else _ANTI_OBVIOUS
 
-            # Use SMART Blend
-            blend_opacity = smart_settings.get('blend', 0.0)
-            steps = 40
-            
-            # INJECT LIGHTING PROMPTS TO FORCE SCANNABILITY
-            lighting_boost = "high contrast, deep shadows, volumetric lighting, sunlit, distinct light and dark areas, chiaroscuro"
-            prompt = f"{prompt}, {lighting_boost}"
-
-            anti_obvious = [
-                "obvious grid", "regular squares", "artificial pattern", 
-                "computer generated grid", "barcode appearance", "border", "frame", "flat lighting", "low contrast"
-            ]
-            negative_prompt = f"{negative_prompt}, {', '.join(anti_obvious)}"
-            
-        elif values.readability == 'scannable':
-            blend_opacity = 0.60
-            steps = 35
-            
-        else:  # balanced
-            blend_opacity = 0.20
-            steps = 35
+    # --- MAGIC PROMPT FOR REALISM ---
+    # Force realistic style unless user explicitly overrides
+    prompt = _with_magic_suffixes(prompt)
+
+    # --- MAGIC NEGATIVE PROMPT ---
+    # Strong anti-cartoon protection, merged with user negative prompt
+    negative_prompt = _with_anti_cartoon(negative_prompt)
+
+    return PromptSpec(
+        prompt=prompt,
+        negative_prompt=negative_prompt,
+        cn_scale=cn_scale_final,
+        control_end=control_end_final,
+        blend_opacity=blend_opacity,
+        steps=steps,
+        contrast=smart_contrast,
+        sharpness=smart_sharpness,
+    )
+
+
+def _post_process_ai(final_img, control_image, values, spec):
+    # SMART ANDROID BOOSTER: apply only if readability is 'hidden' for maximum effect
+    # We trust the Smart Analyzer to give us the right values
+    # Both steps work on uint8 arrays; the image is only rebuilt once at the end
+    if values.readability == 'hidden':
+        # Boost Contrast + Sharpness (Smart Values)
+        final_img = _contrast_sharpen(final_img, spec.contrast, spec.sharpness, as_array=True)
+    
+    # Blend if needed (only if blend_opacity > 0)
+    if spec.blend_opacity > 0:
+        try:
+            final_img = blend_qr_contrast(final_img, control_image, values.data, opacity=spec.blend_opacity)
+        except Exception as pp_e:
+            # If blending fails, use the image as is
+            print(f"Post-processing warning: {pp_e}")
+    return _rgb_image(final_img) if isinstance(final_img, np.ndarray) else final_img
+
+
+def run_ai_batch(jobs, performance_mode, guidance_scale):
+    """
+    Generates a cohort of queued jobs with one pipeline call. jobs: [(task_id, values, seed, spec)],
+    all sharing the batch-wide settings of jobs[0].spec (see _ai_cohorts).
+    """
+    task_ids = [job[0] for job in jobs]
+    try:
+        print(f"Starting Task {', '.join(task_ids)}")
+        # Bound once: the worker never sweeps a running task, so these stay valid for the whole job
+        tasks = [TASKS[task_id] for task_id in task_ids]
+        spec0 = jobs[0][3]
+        steps = spec0.steps
+
+        # 1. Generate Control Images
+        control_images = [_control_image(values.data) for _, values, _, _ in jobs]
 
         # Callback for progress
         def progress_callback(step, timestep, latents):
-            if TASKS.get(task_id, {}).get('status') == 'cancelled':
+            # The batch shares one denoising loop, so it only stops once every job in it is cancelled
+            if all(task['status'] == 'cancelled' for task in tasks):
                 raise InterruptedError("Generation Cancelled")
             
             current_step = step + 1
-            total = TASKS[task_id]['total']
-            percent = int((current_step / total) * 100)
-            TASKS[task_id]['step'] = current_step
-            TASKS[task_id]['progress'] = percent
+            for task_id, task in zip(task_ids, tasks):
+                if task['status'] != 'cancelled':
+                    _update_task(task_id, step=current_step, progress=current_step * 100 // steps)
 
-        # 3. Set total steps
-        TASKS[task_id]['total'] = steps
+        # 2. Set total steps
+        for task_id in task_ids:
+            _update_task(task_id, total=steps)
         
-        # Magic Prompt Logic
-        magic_suffixes = [
-            "raw photo", "photorealistic", "8k uhd", "dslr", "soft lighting", 
-            "high quality", "film grain", "Fujifilm XT3", "intricate details"
-        ]
-        to_append = [m for m in magic_suffixes if m.lower() not in prompt.lower()]
-        if to_append:
-            prompt = f"{prompt}, {', '.join(to_append)}"
-
-        anti_cartoon = [
-            "(deformed, distorted, disfigured:1.3)", "poorly drawn", "bad anatomy", "wrong anatomy", 
-            "extra limb", "missing limb", "floating limbs", "(mutated hands and fingers:1.4)", 
-            "disconnected limbs", "mutation", "mutated", "ugly", "disgusting", "blurry", "amputation", 
-            "(cartoon, anime, 3d, painting, drawing, illustration, sketch, flat, vector art:1.2)",
-            "bad quality", "low quality", "jpeg artifacts"
-        ]
-        if negative_prompt:
-             negative_prompt = f"{negative_prompt}, {', '.join(anti_cartoon)}"
-        else:
-             negative_prompt = ", ".join(anti_cartoon)
-
-        final_img = ai_engine.generate(
-            control_image=control_image,
-            prompt=prompt,
-            negative_prompt=negative_prompt,
-            controlnet_conditioning_scale=cn_scale_final,
+        images = ai_engine.generate_batch(
+            control_images,
+            [spec.prompt for *_, spec in jobs],
+            [spec.negative_prompt for *_, spec in jobs],
+            [seed for _, _, seed, _ in jobs],
+            controlnet_conditioning_scale=spec0.cn_scale,
             guidance_scale=guidance_scale,
             control_guidance_start=0.0,
-            control_guidance_end=control_end_final,
-            seed=seed_val,
+            control_guidance_end=spec0.control_end,
             mode=performance_mode,
+            quant=_AI_QUANT,
             num_inference_steps=steps,
             callback=progress_callback
         )
+    except InterruptedError:
+        print(f"Task {', '.join(task_ids)} Cancelled")
+        for task_id in task_ids:
+            _update_task(task_id, status='cancelled')
+        return
+    except Exception as e:
+        print(f"Task {', '.join(task_ids)} Failed: {e}")
+        traceback.print_exc()
+        for task_id in task_ids:
+            _update_task(task_id, status='failed', error=str(e))
+        return
+
+    # Post-processing is CPU work (NumPy + zlib, both release the GIL), so it runs on
+    # _POST_POOL while this worker moves on to the next GPU batch
+    for (task_id, values, _, spec), task, control_image, final_img in zip(jobs, tasks, control_images, images):
+        _POST_POOL.submit(_finish_ai_task, task_id, task, values, spec, control_image, final_img)
+
 
+def _finish_ai_task(task_id, task, values, spec, control_image, final_img):
+    if task['status'] == 'cancelled':
+        return
+    try:
         if final_img is None:
             raise Exception("AI Generator returned no image")
-        
-        if TASKS.get(task_id, {}).get('status') == 'cancelled':
-            return
-
-        # 4. POST-PROCESSING: SMART ANDROID BOOSTER
-        # Apply only if readability is 'hidden' for maximum effect
-        if values.readability == 'hidden':
-            # Boost Contrast (Smart Value)
-            enhancer = ImageEnhance.Contrast(final_img)
-            final_img = enhancer.enhance(smart_contrast)
-            
-            # Boost Sharpness (Smart Value)
-            enhancer = ImageEnhance.Sharpness(final_img)
-            final_img = enhancer.enhance(smart_sharpness)
-        
-        # Post-Processing with adaptive blending
-        try:
-            # Blend if needed (only if blend_opacity > 0)
-            if blend_opacity > 0:
-                final_img = blend_qr_contrast(final_img, control_image, values.data, opacity=blend_opacity)
-        except Exception as pp_e:
-            print(f"Post-processing warning: {pp_e}")
-            # If blending fails, use the image as is
-            final_img = final_img
 
-        # 5. Save & Finish
-        buf = io.BytesIO()
-        final_img.save(buf, format="PNG")
-        img_b64 = base64.b64encode(buf.getvalue()).decode("ascii")
-        
-        TASKS[task_id]['result'] = img_b64
-        TASKS[task_id]['status'] = 'completed'
-        TASKS[task_id]['progress'] = 100
+        # 3. POST-PROCESSING: SMART ANDROID BOOSTER + adaptive blending
+        final_img = _post_process_ai(final_img, control_image, values, spec)
+
+        # 4. Save & Finish
+        png = _encode_png(final_img)
+        with _TASKS_LOCK:
+            if task_id in TASKS:
+                TASK_RESULTS[task_id] = png
         
-    except InterruptedError:
-        print(f"Task {task_id} Cancelled")
-        TASKS[task_id]['status'] = 'cancelled'
+        _update_task(task_id, result_url=f"/result/{task_id}.png", status='completed', progress=100)
     except Exception as e:
         print(f"Task {task_id} Failed: {e}")
-        import traceback
         traceback.print_exc()
-        TASKS[task_id]['status'] = 'failed'
-        TASKS[task_id]['error'] = str(e)
+        _update_task(task_id, status='failed', error=str(e))
+
+
+def _ai_cohorts(jobs):
+    """
+    Groups queued jobs by the settings a pipeline call applies to the whole batch
+    (mode, CFG, ControlNet scale/end, steps); each group can then run as one batch.
+    """
+    cohorts = {}
+    for task_id, values, prompt, negative_prompt, cn_scale, seed_val, performance_mode, guidance_scale, _ in jobs:
+        try:
+            # Determine parameters based on readability mode (SAME AS SYNC ENDPOINT)
+            # Use the value sent by frontend (which is now auto-updated by JS)
+            spec = _prepare_ai_prompts(values, prompt, negative_prompt, cn_scale)
+        except Exception as e:
+            traceback.print_exc()
+            _update_task(task_id, status='failed', error=str(e))
+            continue
+        key = (performance_mode, guidance_scale, spec.cn_scale, spec.control_end, spec.steps)
+        cohorts.setdefault(key, []).append((task_id, values, seed_val, spec))
+    return cohorts
+
+
+def _claim_task(task_id):
+    """Marks a queued task as processing; False if it was cancelled (or expired) while waiting."""
+    with _TASKS_LOCK:
+        task = TASKS.get(task_id)
+        if task is None or task['status'] == 'cancelled':
+            return False
+        task['status'] = 'processing'
+        _TASK_CONDS[task_id].notify_all()
+        return True
+
+
+# AI jobs run on a single long-lived worker: the pipeline is a process-wide singleton
+# on one GPU, so extra threads would only contend for it. Instead, jobs that arrive
+# together are batched into one pipeline call where the device allows it.
+_AI_QUEUE = queue.Queue()
+# Optional bitsandbytes weight quantization on CUDA: "nf4" or "int8" (unset = full precision)
+_AI_QUANT = os.environ.get("QR_AI_QUANT") or None
+_POST_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ai-post")
+_AI_BATCH_WAIT = 0.03  # seconds to wait for batch mates after the first job arrives
+_ai_worker = None
+_AI_WORKER_LOCK = threading.Lock()
+
+
+def _ai_worker_loop():
+    while True:
+        jobs = [_AI_QUEUE.get()]
+        try:
+            limit = ai_engine.batch_limit()
+            deadline = time.monotonic() + _AI_BATCH_WAIT
+            while len(jobs) < limit:
+                try:
+                    jobs.append(_AI_QUEUE.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            for (performance_mode, guidance_scale, *_), cohort in _ai_cohorts(jobs).items():
+                cohort = [job for job in cohort if _claim_task(job[0])]
+                if cohort:
+                    run_ai_batch(cohort, performance_mode, guidance_scale)
+        except Exception as e:
+            traceback.print_exc()
+            # Don't leave jobs that never started pending forever (a sync request may be waiting on one)
+            for job in jobs:
+                task = TASKS.get(job[0])
+                if task is not None and task['status'] == 'pending':
+                    _update_task(job[0], status='failed', error=str(e))
+        finally:
+            for _ in jobs:
+                _AI_QUEUE.task_done()
+
+
+def _submit_ai_task(values, prompt, negative_prompt, cn_scale, seed_val, performance_mode, guidance_scale,
+                    control_end, future=None):
+    """
+    Creates a task and queues it for the AI worker, the only thread that uses the pipeline.
+    A `future` gets the PNG bytes (or the error) once the task finishes. Returns the task id.
+    """
+    global _ai_worker
+    task_id = str(uuid.uuid4())
+    _add_task(task_id, {
+        'status': 'pending',
+        'progress': 0,
+        'step': 0,
+        'total': 30,
+        'result_url': None,
+        'error': None
+    })
+    if future is not None:
+        with _TASKS_LOCK:
+            _TASK_FUTURES[task_id] = future
+    with _AI_WORKER_LOCK:
+        if _ai_worker is None or not _ai_worker.is_alive():
+            _ai_worker = threading.Thread(target=_ai_worker_loop, name="ai-worker", daemon=True)
+            _ai_worker.start()
+    _AI_QUEUE.put((task_id, values, prompt, negative_prompt, cn_scale, seed_val, performance_mode, guidance_scale, control_end))
+    return task_id
 
 @app.route('/generate_ai', methods=['POST'])
 def generate_ai_endpoint():
@@ -1369,18 +1918,7 @@ def generate_ai_endpoint():
     guidance_scale = float(request.form.get('guidance_scale') or 7.5)
     control_end = float(request.form.get('control_end') or 1.0)
     
-    task_id = str(uuid.uuid4())
-    TASKS[task_id] = {
-        'status': 'pending',
-        'progress': 0,
-        'step': 0,
-        'total': 30,
-        'result': None,
-        'error': None
-    }
-    
-    thread = threading.Thread(target=run_ai_task, args=(task_id, values, prompt, negative_prompt, cn_scale, seed_val, performance_mode, guidance_scale, control_end))
-    thread.start()
+    task_id = _submit_ai_task(values, prompt, negative_prompt, cn_scale, seed_val, performance_mode, guidance_scale, control_end)
     
     return jsonify({'task_id': task_id})
 
@@ -1389,60 +1927,135 @@ def progress_endpoint(task_id):
     task = TASKS.get(task_id)
     if not task:
         return jsonify({'error': 'Task not found'}), 404
-    return jsonify(task)
+    return Response(_json_bytes(task), mimetype='application/json')
+
+@app.route('/progress_stream/<task_id>')
+def progress_stream_endpoint(task_id):
+    with _TASKS_LOCK:
+        cond = _TASK_CONDS.get(task_id)
+    if cond is None:
+        return jsonify({'error': 'Task not found'}), 404
+
+    def stream():
+        last = None
+        deadline = time.monotonic() + PROGRESS_STREAM_MAX_SECONDS
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                # Free this server thread; the page switches to polling /progress
+                yield b"event: poll\ndata: {}\n\n"
+                return
+            with cond:
+                # Wake on the next change to this task; the timeout only sends a keepalive
+                cond.wait_for(lambda: _task_snapshot(task_id) != last, timeout=min(15, remaining))
+                state = _task_snapshot(task_id)
+            if state is None:
+                yield b'data: {"status": "failed", "error": "Task not found"}\n\n'
+                return
+            if state == last:
+                yield b": keepalive\n\n"
+                continue
+            last = state
+            yield b"data: " + _json_bytes(state) + b"\n\n"
+            if state['status'] in ('completed', 'failed', 'cancelled'):
+                return
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/result/<key>.png')
+def result_endpoint(key):
+    with _TASKS_LOCK:
+        png = TASK_RESULTS.get(key)
+    if png is not None:
+        # task_id is a fresh uuid per generation, so the key itself is a valid ETag forever
+        response = send_file(io.BytesIO(png), mimetype='image/png', etag=key, conditional=True, max_age=31536000)
+        response.cache_control.immutable = True
+        return response
+    png = _cache_get(key)
+    if png is None:
+        # Evicted (or the server restarted): plain text, since this is usually an <img> or a download
+        return Response("This result has expired. Please generate it again.\n", status=410,
+                        mimetype='text/plain', headers={'Cache-Control': 'no-store'})
+    # Form-derived key: the same form (e.g. seed=-1) can yield a different image after eviction,
+    # so revalidate on every use against a hash of the content
+    etag = hashlib.blake2b(png, digest_size=16).hexdigest()
+    return send_file(io.BytesIO(png), mimetype='image/png', etag=etag, conditional=True, max_age=0)
 
 @app.route('/cancel/<task_id>', methods=['POST'])
 def cancel_endpoint(task_id):
-    if task_id in TASKS:
-        TASKS[task_id]['status'] = 'cancelled'
+    _update_task(task_id, status='cancelled')
     return jsonify({'status': 'cancelled'})
 
 
+_DEFAULT_VALUES = FormValues(
+    data="https://aserehe.com",
+    size=1024,
+    border=4,
+    dark="#000000",
+    light="#ffffff",
+    dark_alpha=0.50,
+    light_alpha=0.10,
+    rounded=44,
+    preserve_finders=True,
+    strength=1.1,
+    texture=1.0,
+    mode="organic",
+    readability="balanced",
+    guidance_scale=7.5,
+    control_end=1.0,
+)
+
+# The landing page only ever renders the defaults, so it is rendered once
+# and then served from memory (with an ETag so browsers can revalidate).
+_index_page = None  # (html bytes, etag)
+
+
 @app.get("/")
-def index() -> str:
-    values = FormValues(
-        data="https://aserehe.com",
-        size=1024,
-        border=4,
-        dark="#000000",
-        light="#ffffff",
-        dark_alpha=0.50,
-        light_alpha=0.10,
-        rounded=44,
-        preserve_finders=True,
-        strength=1.1,
-        texture=1.0,
-        mode="organic",
-        readability="balanced",
-        guidance_scale=7.5,
-        control_end=1.0,
-    )
+def index() -> Response:
+    global _index_page
+    if _index_page is None:
+        body = _render_page(values=_DEFAULT_VALUES, img_url=None, error=None).encode("utf-8")
+        _index_page = (body, hashlib.blake2b(body, digest_size=16).hexdigest())
 
-    return _render_page(values=values, img_data=None, error=None)
+    body, etag = _index_page
+    response = Response(body, mimetype="text/html")
+    response.set_etag(etag)
+    return response.make_conditional(request)
 
 
 @app.post("/generate")
 def generate() -> str:
     # --- CACHE CHECK ---
-    # Create a unique signature based on all form inputs
-    # We exclude file uploads from hash for simplicity (or read them if needed, but classic mode is fast anyway)
-    # Focus on AI mode which is slow.
+    # The parsed FormValues, the AI-only fields and a digest of the uploaded image identify a result.
+    values = _get_form_values()
+    file = request.files.get("image")
+    upload = file.read() if file and file.filename else b""
     
-    # Sort keys to ensure consistent order
-    form_data_str = "|".join([f"{k}:{v}" for k, v in sorted(request.form.items())])
-    cache_key = hashlib.md5(form_data_str.encode()).hexdigest()
+    form = request.form
+    cache_key = (
+        values,
+        form.get("prompt", ""),
+        form.get("negative_prompt", ""),
+        form.get("cn_scale", ""),
+        form.get("seed", ""),
+        form.get("performance_mode", ""),
+        hashlib.blake2b(upload, digest_size=16).digest() if upload else None,
+    )
     
-    if cache_key in RESULT_CACHE:
-        print(f"Cache HIT for key: {cache_key}")
+    # Stable id for the result: it names the cache entry and the /result/<id>.png URL the page links to
+    result_id = hashlib.blake2b(repr(cache_key).encode(), digest_size=16).hexdigest()
+    result_url = f"/result/{result_id}.png"
+    
+    if _cache_get(result_id) is not None:
+        print(f"Cache HIT for key: {result_id}")
         # Return cached result immediately
-        values = _get_form_values()
-        return _render_page(values=values, img_data=RESULT_CACHE[cache_key], error=None)
+        return _render_page(values=values, img_url=result_url, error=None)
     
-    print(f"Cache MISS for key: {cache_key}")
+    print(f"Cache MISS for key: {result_id}")
 
-    values = _get_form_values()
     if not values.data:
-        return _render_page(values=values, img_data=None, error="Data tidak boleh kosong")
+        return _render_page(values=values, img_url=None, error="Data tidak boleh kosong")
 
     # --- AI ControlNet Mode ---
     if values.mode == 'ai':
@@ -1457,172 +2070,37 @@ def generate() -> str:
         performance_mode = request.form.get('performance_mode', 'balanced')
 
         if not prompt:
-            return _render_page(values=values, img_data=None, error="Prompt is required for AI mode")
-
-        # --- MAGIC PROMPT FOR REALISM ---
-        # Force realistic style unless user explicitly overrides
-        magic_suffixes = [
-            "raw photo", "photorealistic", "8k uhd", "dslr", "soft lighting", 
-            "high quality", "film grain", "Fujifilm XT3", "intricate details"
-        ]
-        
-        # Only append if not already present
-        to_append = [m for m in magic_suffixes if m.lower() not in prompt.lower()]
-        if to_append:
-            prompt = f"{prompt}, {', '.join(to_append)}"
-
-        # --- MAGIC NEGATIVE PROMPT ---
-        # Strong anti-cartoon protection
-        anti_cartoon = [
-            "(deformed, distorted, disfigured:1.3)", "poorly drawn", "bad anatomy", "wrong anatomy", 
-            "extra limb", "missing limb", "floating limbs", "(mutated hands and fingers:1.4)", 
-            "disconnected limbs", "mutation", "mutated", "ugly", "disgusting", "blurry", "amputation", 
-            "(cartoon, anime, 3d, painting, drawing, illustration, sketch, flat, vector art:1.2)",
-            "bad quality", "low quality", "jpeg artifacts"
-        ]
-        
-        # Merge with user negative prompt
-        if negative_prompt:
-             negative_prompt = f"{negative_prompt}, {', '.join(anti_cartoon)}"
-        else:
-             negative_prompt = ", ".join(anti_cartoon)
+            return _render_page(values=values, img_url=None, error="Prompt is required for AI mode")
 
         try:
-            import qrcode
-            from ai_generator import ai_engine
-
-            # 1. Generate Control Image
-            # CRITICAL FIX: Border=0 to prevent "white box" overlay effect!
-            # We want the QR pattern to fill the canvas naturally (Full Bleed)
-            qr = qrcode.QRCode(
-                version=None,
-                error_correction=qrcode.constants.ERROR_CORRECT_H,
-                box_size=10,
-                border=0,  # ZER0 BORDER = NO BOX ARTIFACTS!
-            )
-            qr.add_data(values.data)
-            qr.make(fit=True)
-            
-            control_image = qr.make_image(fill_color="black", back_color="white").convert("RGB")
-
-            # 2. Determine parameters based on readability mode
-            # NOW SMART: We analyze the prompt to adapt strictness!
-            
-            # Default values (overridden below)
-            cn_scale_final = cn_scale
-            control_end_final = 1.0
-            
-            # Context for Post-Processing
-            smart_contrast = 1.0
-            smart_sharpness = 1.0
-            
-            if values.readability == 'hidden':
-                # HIDDEN MODE STRATEGY: SMART ADAPTIVE SHADOW ART
-                
-                # Analyze Prompt
-                smart_settings = smart_analyze_prompt(prompt)
-                print(f"[{threading.current_thread().name}] Smart Analysis: {smart_settings['mode']} (CN: {smart_settings['cn_scale']})")
-                
-                # Logic: If user kept default (1.35), use SMART value. If user changed it, trust user.
-                if cn_scale == 1.35:
-                     cn_scale_final = smart_settings['cn_scale']
-                else:
-                     cn_scale_final = cn_scale # User manual override
-                
-                # Post-Processing Values from Smart Analysis
-                smart_contrast = smart_settings['contrast']
-                smart_sharpness = smart_settings['sharpness']
-
-                control_end_final = 1.0
-                # Use SMART Blend (No longer hardcoded 0.0)
-                # This allows micro-blending (0.15) for smooth subjects
-                blend_opacity = smart_settings.get('blend', 0.0)
-                steps = 40
-                
-                # INJECT LIGHTING & TEXTURE PROMPTS (CONCISE to avoid CLIP truncation)
-                # If it's a "Nature" mode from Smart Analysis, force LUSH visuals
-                if smart_settings['mode'] == "Textured/Nature":
-                     nature_boost = "lush foliage, dense vegetation, organic texture"
-                     prompt = f"{prompt}, {nature_boost}"
-                
-                # General Lighting Boost for Scannability (SHORT KEYWORDS ONLY)
-                lighting_boost = "high contrast, deep shadows, chiaroscuro"
-                prompt = f"{prompt}, {lighting_boost}"
-
-                anti_obvious = [
-                    "obvious grid", "regular squares", "artificial pattern", 
-                    "computer generated grid", "barcode appearance", "border", "frame", "flat lighting", "low contrast"
-                ]
-                negative_prompt = f"{negative_prompt}, {', '.join(anti_obvious)}"
-                
-            elif values.readability == 'scannable':
-                # SCANNABLE: Standard strong mode with helper blending
-                blend_opacity = 0.60
-                steps = 35
-                
-            else:  # balanced (default)
-                blend_opacity = 0.20
-                steps = 35
-
-            # 3. Run AI Generation
-            final_img = ai_engine.generate(
-                control_image=control_image,
-                prompt=prompt,
-                negative_prompt=negative_prompt,
-                controlnet_conditioning_scale=cn_scale_final,
-                guidance_scale=guidance_scale,
-                control_guidance_start=0.0,
-                control_guidance_end=control_end_final,
-                num_inference_steps=steps,
-                seed=seed_val,
-                mode=performance_mode
-            )
-
-            if final_img is None:
-                raise Exception("AI Generator returned no image. Check terminal for memory errors.")
+            # Queued like /generate_ai, so the one AI worker stays the only user of the
+            # pipeline; this request thread just waits for the finished PNG
+            future = Future()
+            _submit_ai_task(values, prompt, negative_prompt, cn_scale, seed_val, performance_mode,
+                            guidance_scale, control_end, future=future)
+            png = future.result()
+
+            # Store in cache (served by /result/<id>.png)
+            _cache_put(result_id, png)
             
-            # 4. POST-PROCESSING: SMART ANDROID BOOSTER
-            # We trust the Smart Analyzer to give us the right values
-            if values.readability == 'hidden':
-                 # Boost Contrast
-                 enhancer = ImageEnhance.Contrast(final_img)
-                 final_img = enhancer.enhance(smart_contrast)
-                 
-                 # Boost Sharpness
-                 enhancer = ImageEnhance.Sharpness(final_img)
-                 final_img = enhancer.enhance(smart_sharpness)
-            
-            # 5. Blend if needed (Only for Scannable/Balanced modes, Hidden uses 0.0)
-            if blend_opacity > 0:
-                 try:
-                     final_img = blend_qr_contrast(final_img, control_image, values.data, opacity=blend_opacity)
-                 except Exception as pp_e:
-                     print(f"Post-processing warning: {pp_e}")
-
-            buf = io.BytesIO()
-            final_img.save(buf, format="PNG")
-            img_b64 = base64.b64encode(buf.getvalue()).decode("ascii")
-            
-            # Store in cache
-            RESULT_CACHE[cache_key] = img_b64
-            
-            return _render_page(values=values, img_data=img_b64, error=None)
+            return _render_page(values=values, img_url=result_url, error=None)
 
         except Exception as e:
-            import traceback
             traceback.print_exc() # Print full error to terminal
-            return _render_page(values=values, img_data=None, error=f"AI Error: {str(e)}")
+            return _render_page(values=values, img_url=None, error=f"AI Error: {str(e)}")
 
     # --- Standard Frequency Separation Mode ---
+    out_size = max(256, min(2048, values.size))
     bg = None
-    file = request.files.get("image")
-    if file and file.filename:
-        raw = file.read()
+    if upload:
         try:
-            bg = Image.open(io.BytesIO(raw))
+            bg = Image.open(io.BytesIO(upload))
+            # JPEG only: libjpeg decodes straight to RGB at a reduced DCT scale (1/2 .. 1/8)
+            # while the image stays at least out_size on each side. No-op for other formats.
+            bg.draft("RGB", (out_size, out_size))
             bg.load()
         except Exception:
-            return _render_page(values=values, img_data=None, error="File gambar tidak valid")
+            return _render_page(values=values, img_url=None, error="File gambar tidak valid")
 
     try:
         style = Style(
@@ -1638,28 +2116,46 @@ def generate() -> str:
         img = generate_art_qr(
             data=values.data,
             background=bg,
-            out_size=max(256, min(2048, values.size)),
+            out_size=out_size,
             border_modules=max(0, min(10, values.border)),
             dark_color=_parse_color(values.dark),
             light_color=_parse_color(values.light),
             style=style,
         )
     except Exception as exc:
-        return _render_page(values=values, img_data=None, error=str(exc))
+        return _render_page(values=values, img_url=None, error=str(exc))
 
-    buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    img_b64 = base64.b64encode(buf.getvalue()).decode("ascii")
-    
     # Cache organic result too
-    RESULT_CACHE[cache_key] = img_b64
+    _cache_put(result_id, _encode_png(img))
     
-    return _render_page(values=values, img_data=img_b64, error=None)
+    return _render_page(values=values, img_url=result_url, error=None)
 
 
 def main() -> int:
     # Use PORT 5000 (Standard Flask) to avoid 8080 conflicts in Colab
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    host, port = "0.0.0.0", 5000
+    debug = os.environ.get("FLASK_DEBUG") == "1"
+    # Under the reloader only the child process (WERKZEUG_RUN_MAIN) serves requests
+    if os.environ.get("QR_AI_PRELOAD") == "1" and (not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true"):
+        # Load (and on CUDA compile + warm up) the pipeline while the server starts,
+        # so the first AI request doesn't pay for it
+        threading.Thread(target=ai_engine.load_model, kwargs={"quant": _AI_QUANT},
+                         name="ai-preload", daemon=True).start()
+    if debug:
+        # Debugger + reloader; the reloader imports this module (and anything it loads) twice
+        app.run(host=host, port=port, debug=True)
+        return 0
+    try:
+        from waitress import serve
+    except ImportError:
+        print("waitress not installed, falling back to the Flask development server")
+        app.run(host=host, port=port, threaded=True)
+        return 0
+    # Uploads, PNG encoding and progress streams run on these threads while the AI worker uses the GPU.
+    # Each open /progress_stream holds one thread for up to PROGRESS_STREAM_MAX_SECONDS, and a sync AI
+    # /generate holds one until its image is done: size this above the expected number of watchers.
+    threads = int(os.environ.get("QR_WEB_THREADS", "16"))
+    serve(app, host=host, port=port, threads=threads)
     return 0
 
 